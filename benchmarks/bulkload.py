@@ -0,0 +1,82 @@
+"""Benchmark comparing the ways of filling the database: one product at a
+time with Manager.create(), batch by batch with the multi-row INSERTs of
+install.py, and at once with LOAD DATA LOCAL INFILE.
+
+Each run fills empty shadow copies of the tables, suffixed with "_bench",
+which are dropped afterwards, so the live tables are left untouched.
+
+Usage: python -m benchmarks.bulkload [--products N]
+"""
+
+import argparse
+import time
+
+from benchmarks.processing import make_products
+from install import save_batch
+from purbeurre.bulkload import BulkLoader
+from purbeurre.database import ShadowTables
+from purbeurre.models import Category, Product, Store
+from purbeurre.processors import ProductProcessor
+
+
+def run_create(products):
+    for product_info in products:
+        categories = product_info.pop("categories")
+        stores = product_info.pop("stores")
+        product = Product.manager.create(**product_info)
+        product.add_categories(*(
+            Category.manager.create(name=name) for name in categories
+        ))
+        product.add_stores(*(
+            Store.manager.create(name=name) for name in stores
+        ))
+
+
+def run_batches(products):
+    for start in range(0, len(products), 1000):
+        save_batch(products[start:start + 1000])
+
+
+def run_load(products):
+    with BulkLoader() as loader:
+        loader.add_all(products)
+        loader.load()
+
+
+def measure(function, products):
+    """Returns the time taken by function on empty tables, in seconds."""
+    with ShadowTables(suffix="_bench") as tables:
+        tables.abandon()
+        # Each method starts with cold caches of names
+        Category.manager.ids.clear()
+        Store.manager.ids.clear()
+        start = time.perf_counter()
+        function([dict(product) for product in products])
+        return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--products", type=int, default=10000)
+    args = parser.parse_args()
+
+    products = list(
+        ProductProcessor().iter_process(make_products(args.products))
+    )
+    timings = {
+        "Manager.create():": measure(run_create, products),
+        "multi-row INSERTs:": measure(run_batches, products),
+        "LOAD DATA:": measure(run_load, products),
+    }
+
+    reference = timings["Manager.create():"]
+    for method, elapsed in timings.items():
+        print(
+            f"{method:<18} {elapsed:.2f} s, "
+            f"{len(products) / elapsed:.0f} products/s "
+            f"({reference / elapsed:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
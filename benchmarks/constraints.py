@@ -0,0 +1,69 @@
+"""Benchmark comparing the bulk load of a catalog into tables created with
+their keys and foreign keys, checked for every row, and into bare tables
+whose keys and foreign keys are built in one pass once they are filled.
+
+Each run fills shadow copies of the tables, suffixed with "_bench", which
+are dropped afterwards, so the live tables are left untouched.
+
+Usage: python -m benchmarks.constraints [--products N]
+"""
+
+import argparse
+import time
+
+from benchmarks.bulkload import run_batches, run_load
+from benchmarks.processing import make_products
+from purbeurre.database import (
+    ShadowTables,
+    create_constraints,
+    create_tables,
+    drop_tables,
+)
+from purbeurre.models import Category, Store
+from purbeurre.processors import ProductProcessor
+
+
+def measure(function, products, constraints):
+    """Returns the time taken by function on empty tables, constraints
+    included, in seconds.
+    """
+    with ShadowTables(suffix="_bench") as tables:
+        tables.abandon()
+        # The shadow tables are created again, without their constraints
+        # for the deferred case
+        drop_tables()
+        create_tables(constraints)
+        Category.manager.ids.clear()
+        Store.manager.ids.clear()
+        start = time.perf_counter()
+        function([dict(product) for product in products])
+        if not constraints:
+            problems = create_constraints()
+            if problems:
+                raise RuntimeError(f"faulty rows: {problems}")
+        return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--products", type=int, default=100000)
+    args = parser.parse_args()
+
+    products = list(
+        ProductProcessor().iter_process(make_products(args.products))
+    )
+    for method, function in (
+        ("multi-row INSERTs", run_batches),
+        ("LOAD DATA", run_load),
+    ):
+        inline = measure(function, products, constraints=True)
+        deferred = measure(function, products, constraints=False)
+        print(
+            f"{method}: {inline:.2f} s with the constraints, "
+            f"{deferred:.2f} s when they are built afterwards "
+            f"({inline / deferred:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
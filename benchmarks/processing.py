@@ -0,0 +1,89 @@
+"""Micro-benchmark comparing the cost per product of the single-pass
+ProductProcessor and of the ParallelProcessor with the
+ProductValidator.filter() and ProductNormalizer.normalize_all() chain.
+
+Usage: python -m benchmarks.processing [--products N] [--repeat N]
+"""
+
+import argparse
+import time
+from copy import deepcopy
+
+from purbeurre.normalizers import ProductNormalizer
+from purbeurre.parallel import ParallelProcessor
+from purbeurre.processors import ProductProcessor
+from purbeurre.validators import ProductValidator
+
+
+def make_products(number):
+    """Builds products shaped like those downloaded from openfoodfacts,
+    one in ten being invalid.
+    """
+    products = []
+    for index in range(number):
+        products.append({
+            "code": f"{3017620422003 + index}",
+            "product_name": f"Pâte à tartiner aux noisettes {index}",
+            "categories": (
+                "Petit-déjeuners,Produits à tartiner,Produits à tartiner "
+                "sucrés,Pâtes à tartiner,Pâtes à tartiner aux noisettes"
+            ),
+            "stores": "Carrefour,Auchan,Leclerc",
+            "nutriscore_grade": "e",
+            "url": f"https://fr.openfoodfacts.org/produit/{index}",
+            "generic_name": "" if index % 10 == 0 else "Pâte à tartiner",
+        })
+    return products
+
+
+def run_chain(products):
+    products = ProductValidator().filter(products)
+    ProductNormalizer().normalize_all(products)
+    return products
+
+
+def run_processor(products):
+    return list(ProductProcessor().iter_process(products))
+
+
+def run_parallel(products):
+    return ParallelProcessor().process_all(products)
+
+
+def measure(function, products, repeat):
+    """Returns the best time per product of function, in microseconds."""
+    best = None
+    for i in range(repeat):
+        # The chain modifies the products, each run gets fresh copies
+        copies = deepcopy(products)
+        start = time.perf_counter()
+        function(copies)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / len(products) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--products", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    products = make_products(args.products)
+    chain = measure(run_chain, products, args.repeat)
+    processor = measure(run_processor, products, args.repeat)
+    parallel = measure(run_parallel, products, args.repeat)
+    print(f"filter + normalize_all: {chain:.2f} µs per product")
+    print(
+        f"ProductProcessor:       {processor:.2f} µs per product "
+        f"({chain / processor:.1f}x)"
+    )
+    print(
+        f"ParallelProcessor:      {parallel:.2f} µs per product "
+        f"({chain / parallel:.1f}x, "
+        f"{ParallelProcessor().plan(len(products))[0]} processes)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,50 +1,646 @@
 """Script managing the creation and filling of the database."""
 
-from settings import PRODUCT_CLIENT_PAGE_SIZE, PRODUCT_CLIENT_NUMBER_OF_PAGES
-from purbeurre.database import create_tables
-from purbeurre.apiclients import OpenfoodfactsClient
-from purbeurre.validators import ProductValidator
-from purbeurre.normalizers import ProductNormalizer
-from purbeurre.models import Product, Category, Store
+import argparse
+import time
+from itertools import islice
+
+from settings import (
+    DB_BATCH_SIZE,
+    PRODUCT_CLIENT_LANGS,
+    PRODUCT_CLIENT_PAGE_SIZE,
+    PRODUCT_CLIENT_NUMBER_OF_PAGES,
+    PRODUCT_CLIENT_MAX_WORKERS,
+    PRODUCT_CLIENT_RATE_LIMIT,
+    PRODUCT_CLIENT_MAX_RETRIES,
+    HTTP_CACHE_DIR,
+    HTTP_CACHE_TTL,
+    HTTP_CACHE_MAX_SIZE,
+    INSTALL_CHECKPOINT_FILE,
+    PROCESSING_WORKERS,
+    PIPELINE_QUEUE_SIZE,
+    SYNC_STATE_FILE,
+    SYNC_OVERLAP,
+)
+from purbeurre.database import (
+    ShadowTables,
+    create_constraints,
+    create_tables,
+    drop_tables,
+    transaction,
+)
+from purbeurre.bulkload import BulkLoadError, BulkLoader
+from purbeurre.cache import ResponseCache
+from purbeurre.checkpoints import InstallCheckpoint, SyncState
+from purbeurre.dumps import iter_dump_products
+from purbeurre.pipeline import Pipeline
+from purbeurre.processors import ProductProcessor
+from purbeurre.validators import BarcodeSet
+from purbeurre.models import (
+    Product,
+    Category,
+    Store,
+    ProductCategory,
+    ProductStore,
+)
+
+
+def split_products(products_info):
+    """Separates normalized products from the names of their categories and
+    stores.
+
+    Return:
+        A (products, category_names, store_names) tuple of lists, the names
+        being lists of names in the order of the products.
+
+    """
+    products = []
+    category_names = []
+    store_names = []
+    for product_info in products_info:
+        # Retrieving categories and stores
+        category_names.append(product_info.pop("categories"))
+        store_names.append(product_info.pop("stores"))
+        products.append(Product(**product_info))
+    return products, category_names, store_names
+
+
+@transaction()
+def save_batch(products_info, existing_ids=()):
+    """Saves a batch of normalized products with their categories and
+    stores, with a few multi-row INSERTs committed by a single transaction.
+
+    Args:
+        products_info (list): normalized products.
+        existing_ids (collection): ids of the products whose row has already
+        been saved by an interrupted run, only their associations are saved
+        again.
+
+    """
+    products, category_names, store_names = split_products(products_info)
+
+    # Registration of products
+    Product.manager.bulk_create(
+        (product for product in products if product.id not in existing_ids),
+        batch_size=DB_BATCH_SIZE,
+    )
+
+    # Creation of categories and stores, which gets their ids, the names
+    # already in the cache of the managers are not sent to the database
+    categories = {
+        name: Category(name=name) for names in category_names for name in names
+    }
+    Category.manager.bulk_create(categories.values(), batch_size=DB_BATCH_SIZE)
+    stores = {
+        name: Store(name=name) for names in store_names for name in names
+    }
+    Store.manager.bulk_create(stores.values(), batch_size=DB_BATCH_SIZE)
+
+    # Association of the categories and stores with the products
+    ProductCategory.manager.bulk_create(
+        (
+            ProductCategory(product=product, category=categories[name])
+            for product, names in zip(products, category_names)
+            for name in names
+        ),
+        batch_size=DB_BATCH_SIZE,
+    )
+    ProductStore.manager.bulk_create(
+        (
+            ProductStore(product=product, store=stores[name])
+            for product, names in zip(products, store_names)
+            for name in names
+        ),
+        batch_size=DB_BATCH_SIZE,
+    )
+
+
+@transaction()
+def refresh_batch(products_info):
+    """Saves a batch of normalized products which may already be in the
+    database, only writing the products, categories and stores which
+    changed, in a single transaction.
+
+    Args:
+        products_info (list): normalized products.
+
+    Return:
+        The number of products which were new or modified.
+
+    """
+    products, category_names, store_names = split_products(products_info)
+    changed_products = Product.manager.bulk_upsert(
+        products, batch_size=DB_BATCH_SIZE
+    )
+
+    category_ids = Category.manager.resolve_ids(
+        (name for names in category_names for name in names),
+        batch_size=DB_BATCH_SIZE,
+    )
+    ProductCategory.manager.replace({
+        product.id: {category_ids[name] for name in names}
+        for product, names in zip(products, category_names)
+    })
+    store_ids = Store.manager.resolve_ids(
+        (name for names in store_names for name in names),
+        batch_size=DB_BATCH_SIZE,
+    )
+    ProductStore.manager.replace({
+        product.id: {store_ids[name] for name in names}
+        for product, names in zip(products, store_names)
+    })
+    return len(changed_products)
+
+
+def product_exists(product_id):
+    """Returns True if a product is present in the database."""
+    try:
+        Product.manager.get_by_id(product_id)
+    except ValueError:
+        return False
+    return True
+
+
+def save_products(products, checkpoint, refresh=False):
+    """Saves normalized products batch by batch, recording the progress in
+    checkpoint.
+
+    Args:
+        products (iterable): normalized products.
+        checkpoint (InstallCheckpoint): journal of the installation.
+        refresh (bool): True if the products may already be in the
+        database, in which case they are updated.
+
+    """
+    products = iter(products)
+    while True:
+        batch = list(islice(products, DB_BATCH_SIZE))
+        if not batch:
+            return
+        # Products already saved, by an interrupted run or because they
+        # appear on several pages, are skipped
+        batch = [
+            product_info for product_info in batch
+            if not checkpoint.is_product_saved(product_info["id"])
+        ]
+        if not batch:
+            continue
+        product_ids = [product_info["id"] for product_info in batch]
+        if refresh:
+            # Refreshing is idempotent, an interrupted batch is simply
+            # refreshed again
+            refresh_batch(batch)
+            checkpoint.mark_products_saved(product_ids)
+            continue
+        existing_ids = {
+            product_id for product_id in product_ids
+            if checkpoint.is_product_pending(product_id)
+            and product_exists(product_id)
+        }
+        checkpoint.mark_products_pending(product_ids)
+        save_batch(batch, existing_ids)
+        checkpoint.mark_products_saved(product_ids)
+
+
+def make_client(langs):
+    """Creates the client downloading the products from the endpoints of
+    langs, in order of preference.
+    """
+    # requests is only imported by the commands which download products
+    from purbeurre.apiclients import (
+        OpenfoodfactsClient,
+        OpenfoodfactsMultiClient,
+    )
+
+    cache = None
+    if HTTP_CACHE_DIR is not None:
+        cache = ResponseCache(
+            HTTP_CACHE_DIR, ttl=HTTP_CACHE_TTL, max_size=HTTP_CACHE_MAX_SIZE
+        )
+    options = {
+        "max_workers": PRODUCT_CLIENT_MAX_WORKERS,
+        "cache": cache,
+        "rate_limit": PRODUCT_CLIENT_RATE_LIMIT,
+        "max_retries": PRODUCT_CLIENT_MAX_RETRIES,
+    }
+    if len(langs) > 1:
+        # The endpoints are downloaded concurrently and merged by barcode
+        return OpenfoodfactsMultiClient(langs, **options)
+    return OpenfoodfactsClient(lang=langs[0], **options)
+
+
+def install_from_api(
+    langs, checkpoint, processor, loader=None, refresh=False
+):
+    """Fills the database with products downloaded from openfoodfacts.
+
+    Args:
+        langs (list): openfoodfacts endpoints, in order of preference.
+        loader (BulkLoader): loader collecting the products instead of
+        saving them, None saves them page by page.
+        refresh (bool): True to update the products already saved.
+
+    Return:
+        True if every page has been downloaded.
+
+    """
+    client = make_client(langs)
+    barcodes = BarcodeSet()
+
+    def process_page(item):
+        page, products = item
+        # Validate and normalize the received data
+        products = processor.iter_process(products)
+        # Keep a single product per barcode
+        return page, list(barcodes.iter_unique(products, field="id"))
+
+    def write_page(item):
+        page, products = item
+        if loader is not None:
+            loader.add_all(products)
+            return
+        save_products(products, checkpoint, refresh)
+        checkpoint.mark_page_done(page)
+
+    # Download data from openfoodfacts one page at a time, skipping the
+    # pages saved by an interrupted run. The next page is downloaded while
+    # the current one is processed and the previous one is saved.
+    pages = client.iter_pages(
+        page_size=PRODUCT_CLIENT_PAGE_SIZE,
+        number_of_pages=PRODUCT_CLIENT_NUMBER_OF_PAGES,
+        skip_pages=() if loader is not None else checkpoint.pages,
+    )
+    pipeline = (
+        Pipeline(queue_size=PIPELINE_QUEUE_SIZE)
+        .source("fetch", pages)
+        .stage("process", process_page)
+        .stage("write", write_page)
+    )
+    pipeline.run()
+    print(pipeline.report())
+
+    # Report the volume downloaded from openfoodfacts
+    for page, size in sorted(client.bytes_transferred.items()):
+        print(f"Page {page}: {size / 1024:.1f} kB transferred")
+    print(
+        f"Total: {sum(client.bytes_transferred.values()) / 1024:.1f} kB "
+        f"transferred"
+    )
+
+    if client.failed_pages:
+        print(
+            f"Pages {sorted(client.failed_pages)} could not be downloaded, "
+            f"run the installation again to complete it"
+        )
+        return False
+    return True
+
+
+def sync_from_api(langs, processor, sync_state):
+    """Updates the installed products modified on openfoodfacts since the
+    last synchronization of each endpoint.
+
+    Args:
+        langs (list): openfoodfacts endpoints, in order of preference.
+        processor (ProductProcessor): processor of the products.
+        sync_state (SyncState): marks from which the endpoints are synced.
+
+    Return:
+        True if every endpoint has been synced.
+
+    """
+    barcodes = BarcodeSet()
+    complete = True
+    for lang in langs:
+        since = sync_state.get(lang)
+        if since is None:
+            print(
+                f"The {lang} endpoint has never been synced, run "
+                f"install.py --refresh --lang {lang} first"
+            )
+            complete = False
+            continue
+        client = make_client([lang])
+        newest = since
+        updated = 0
+
+        def process_page(item):
+            nonlocal newest
+            page, products = item
+            for product in products:
+                newest = max(newest, product.get("last_modified_t", since))
+            products = processor.iter_process(products)
+            # A product modified on several endpoints is taken from the
+            # preferred one
+            return list(barcodes.iter_unique(products, field="id"))
+
+        def write_page(products):
+            nonlocal updated
+            # Only the installed products are kept up to date
+            existing_ids = Product.manager.filter_existing_ids(
+                product_info["id"] for product_info in products
+            )
+            updated += refresh_batch([
+                product_info for product_info in products
+                if product_info["id"] in existing_ids
+            ])
+
+        pipeline = (
+            Pipeline(queue_size=PIPELINE_QUEUE_SIZE)
+            .source("fetch", client.iter_modified_pages(
+                since, page_size=PRODUCT_CLIENT_PAGE_SIZE
+            ))
+            .stage("process", process_page)
+            .stage("write", write_page)
+        )
+        pipeline.run()
+        print(pipeline.report())
+        print(f"{lang}: {updated} products updated")
+
+        if client.failed_pages:
+            print(
+                f"{lang}: pages {sorted(client.failed_pages)} could not be "
+                f"downloaded, the next synchronization starts from the "
+                f"same time"
+            )
+            complete = False
+        else:
+            # The next synchronization starts from the most recent product
+            # seen, which was modified before the download started
+            sync_state.set(lang, max(since, newest - SYNC_OVERLAP))
+    return complete
+
+
+def install_from_dump(
+    path, countries, categories, checkpoint, loader=None, refresh=False
+):
+    """Fills the database with the products of an openfoodfacts export."""
+    from purbeurre.parallel import ParallelProcessor
+
+    products = iter_dump_products(
+        path, countries=countries, categories=categories
+    )
+    # Exports are large enough to spread the processing over several
+    # processes
+    processor = ParallelProcessor(max_workers=PROCESSING_WORKERS)
+    products = processor.iter_process(products)
+    products = BarcodeSet().iter_unique(products, field="id")
+    # The products are saved while the next batch is read and processed
+    batches = iter(lambda: list(islice(products, DB_BATCH_SIZE)), [])
+
+    def write_batch(batch):
+        if loader is not None:
+            loader.add_all(batch)
+        else:
+            save_products(batch, checkpoint, refresh)
+
+    pipeline = (
+        Pipeline(queue_size=PIPELINE_QUEUE_SIZE)
+        .source("read and process", batches)
+        .stage("write", write_batch)
+    )
+    pipeline.run()
+    print(pipeline.report())
+
+
+def install_with_load(args):
+    """Fills the empty tables at once with LOAD DATA LOCAL INFILE.
+
+    Nothing is loaded if a page could not be downloaded, since such an
+    installation could not be resumed.
+
+    The tables are created again without their keys and foreign keys, which
+    are built once every row is loaded.
+
+    Return:
+        True if the products have been loaded.
+
+    Raises:
+        BulkLoadError if the loaded rows break a constraint.
+
+    """
+    with BulkLoader() as loader:
+        # Fail before downloading anything if the tables are not empty
+        loader.check_empty()
+        if args.dump:
+            install_from_dump(
+                args.dump, args.countries, args.categories, None, loader
+            )
+            complete = True
+        else:
+            complete = install_from_api(
+                args.langs or PRODUCT_CLIENT_LANGS,
+                None,
+                ProductProcessor(),
+                loader,
+            )
+        if not complete:
+            print("Nothing has been loaded")
+            return False
+        drop_tables()
+        create_tables(constraints=False)
+        try:
+            for table, rows in loader.load().items():
+                print(f"{rows} rows loaded into {table}")
+            problems = create_constraints()
+            if problems:
+                raise BulkLoadError({
+                    f"{problem} in {table}": count
+                    for table, violations in problems.items()
+                    for problem, count in violations.items()
+                })
+        except BaseException:
+            # Tables left without constraints would never get them
+            drop_tables()
+            create_tables()
+            raise
+    return True
+
+
+def rebuild(args, langs, checkpoint, processor):
+    """Installs the products in shadow tables which replace the live ones
+    once the installation is complete.
+    """
+    started_at = time.time()
+    with ShadowTables() as shadow:
+        if args.method == "load":
+            complete = install_with_load(args)
+        elif args.dump:
+            install_from_dump(
+                args.dump, args.countries, args.categories, checkpoint
+            )
+            complete = True
+        else:
+            complete = install_from_api(langs, checkpoint, processor)
+        if not complete:
+            print("The rebuild is incomplete, the current tables are kept")
+            shadow.abandon()
+    if complete and not args.dump:
+        sync_state = SyncState(SYNC_STATE_FILE)
+        for lang in langs:
+            sync_state.set(lang, int(started_at) - SYNC_OVERLAP)
 
 
 def main():
     """Primary entry point for the installation script."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="ignore the progress of an interrupted installation",
+    )
+    parser.add_argument(
+        "--lang",
+        action="append",
+        dest="langs",
+        choices=["fr", "en", "world"],
+        help="openfoodfacts endpoint to download the products from, can be "
+             "repeated in order of preference (default: "
+             f"{', '.join(PRODUCT_CLIENT_LANGS)})",
+    )
+    parser.add_argument(
+        "--dump",
+        metavar="PATH",
+        help="install the products of an openfoodfacts export (.jsonl or "
+             ".csv, optionally .gz) instead of downloading them",
+    )
+    parser.add_argument(
+        "--country",
+        action="append",
+        dest="countries",
+        help="with --dump, only keep the products sold in this country "
+             "(can be repeated)",
+    )
+    parser.add_argument(
+        "--category",
+        action="append",
+        dest="categories",
+        help="with --dump, only keep the products of this category "
+             "(can be repeated)",
+    )
+    parser.add_argument(
+        "--method",
+        choices=["insert", "load"],
+        default="insert",
+        help="insert: save the products batch by batch, an interrupted "
+             "installation can be resumed; load: fill empty tables at once "
+             "with LOAD DATA LOCAL INFILE, the fastest way to install a "
+             "whole catalog (default: insert)",
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="update an installed database: new products are added and "
+             "only the products, categories and stores which changed are "
+             "written",
+    )
+    parser.add_argument(
+        "--prune",
+        action="store_true",
+        help="with --refresh, delete the products which are no longer "
+             "provided, except those saved as favorites",
+    )
+    parser.add_argument(
+        "--sync",
+        action="store_true",
+        help="update the installed products modified on openfoodfacts "
+             "since the last installation or synchronization",
+    )
+    parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="install the products in new tables which replace the current "
+             "ones at once, keeping the favorites; the application can be "
+             "used during the rebuild",
+    )
+    args = parser.parse_args()
+    if args.rebuild and (args.refresh or args.sync):
+        parser.error("--rebuild cannot be used with --refresh or --sync")
+    if args.sync and (args.dump or args.method == "load" or args.prune):
+        parser.error("--sync cannot be used with --dump, --method or --prune")
+    if args.prune and not args.refresh:
+        parser.error("--prune requires --refresh")
+    if args.refresh and args.method == "load":
+        parser.error("--refresh cannot be used with --method load")
+
     # We instantiate the necessary objects
-    client = OpenfoodfactsClient()
-    validator = ProductValidator()
-    normalizer = ProductNormalizer()
+    started_at = time.time()
+    processor = ProductProcessor()
+    langs = args.langs or PRODUCT_CLIENT_LANGS
+    sync_state = SyncState(SYNC_STATE_FILE)
+    if args.sync:
+        create_tables()
+        if not sync_from_api(langs, processor, sync_state):
+            raise SystemExit(1)
+        return
 
-    # Download data from openfoodfacts
-    products = client.get_products_by_popularity(
-        page_size=PRODUCT_CLIENT_PAGE_SIZE,
-        number_of_pages=PRODUCT_CLIENT_NUMBER_OF_PAGES,
+    checkpoint = InstallCheckpoint(
+        INSTALL_CHECKPOINT_FILE,
+        page_size=None if args.dump else PRODUCT_CLIENT_PAGE_SIZE,
     )
-    # Validate the received data
-    products = validator.filter(products)
-    # Normalize received data
-    normalizer.normalize_all(products)
+    if args.rebuild:
+        # The progress of the rebuild is lost with the new tables if it
+        # is interrupted, it always starts from scratch
+        checkpoint.clear()
+        try:
+            rebuild(args, langs, checkpoint, processor)
+        finally:
+            checkpoint.clear()
+        return
+
+    if args.restart:
+        checkpoint.clear()
+    elif checkpoint.resumed:
+        print(
+            f"Resuming the installation: {len(checkpoint.pages)} pages and "
+            f"{len(checkpoint.products)} products already saved"
+        )
 
     # Create the database tables
     create_tables()
-    # Fill the database
-    for product_info in products:
-        # Retrieving categories and stores
-        categories = product_info.pop("categories")
-        stores = product_info.pop("stores")
+    if args.method == "load":
+        install_with_load(args)
+        return
+    # The names saved by a previous run are resolved without queries
+    Category.manager.preload()
+    Store.manager.preload()
 
-        # Registration of product
-        product = Product.manager.create(**product_info)
+    if args.dump:
+        install_from_dump(
+            args.dump,
+            args.countries,
+            args.categories,
+            checkpoint,
+            refresh=args.refresh,
+        )
+        complete = True
+    else:
+        resumed = checkpoint.resumed
+        complete = install_from_api(
+            langs, checkpoint, processor, refresh=args.refresh
+        )
+        if complete and not resumed:
+            # The products modified after the start of the download are
+            # provided by the next synchronization
+            for lang in langs:
+                sync_state.set(lang, int(started_at) - SYNC_OVERLAP)
 
-        # Creation of categories and association with the product
-        for category_name in categories:
-            category = Category.manager.create(name=category_name)
-            product.add_categories(category)
+    if complete and args.prune and not checkpoint.products:
+        print("No product has been provided, nothing is deleted")
+    elif complete and args.prune:
+        # Every product provided has been recorded in the checkpoint,
+        # including those saved by an interrupted run
+        pruned = Product.manager.prune(
+            checkpoint.products, batch_size=DB_BATCH_SIZE
+        )
+        print(f"{pruned} products no longer provided have been deleted")
 
-        # Creation of stores and association with the product
-        for store_name in stores:
-            store = Store.manager.create(name=store_name)
-            product.add_stores(store)
+    if complete:
+        # The installation is complete, the next one starts from scratch
+        checkpoint.clear()
+    else:
+        # The checkpoint is kept so that the next run only downloads the
+        # missing pages
+        checkpoint.close()
 
 
 if __name__ == "__main__":
@@ -2,19 +2,174 @@
 to different APIS.
 """
 
+import codecs
+import json
+import queue
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from itertools import count
+
 import requests
+from requests.adapters import HTTPAdapter
+
+from purbeurre.concurrency import ordered_map
+from purbeurre.throttling import AdaptiveLimiter, TokenBucket
+from purbeurre.validators import PRODUCT_FIELDS
+
+SEPARATORS = re.compile(r"[\s,]*")
+
+# Sort orders of the search API
+POPULARITY = "unique_scans_n"
+LAST_MODIFIED = "last_modified_t"
+
+# HTTP statuses of the errors which are worth retrying
+TRANSIENT_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TruncatedResponseError(requests.exceptions.RequestException):
+    """Raised when the body of a response is cut off or is not valid
+    JSON, which is worth retrying like a network failure.
+    """
+
+
+def iter_json_array(chunks, key):
+    """Incrementally decodes the items of an array in a JSON document.
+
+    The document is read chunk by chunk and each item is decoded as soon
+    as it is complete, so a single item is in memory at a time instead of
+    the whole document.
+
+    Args:
+        chunks (iterable): chunks of bytes of the document encoded in UTF-8.
+        key (str): key under which the array is stored in the document.
+
+    Return:
+        A generator of the decoded items. Nothing is yielded if the
+        document has no such key.
+
+    Raises:
+        json.JSONDecodeError if the document is not valid JSON.
+
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    start = re.compile(rf'"{re.escape(key)}"\s*:\s*\[')
+    chunks = iter(chunks)
+
+    # Looks for the beginning of the array
+    buffer = ""
+    for chunk in chunks:
+        buffer += text_decoder.decode(chunk)
+        match = start.search(buffer)
+        if match is not None:
+            break
+        # Keeps the end of the buffer in case the key is cut in two
+        buffer = buffer[-(len(key) + 64):]
+    else:
+        return
+
+    position = match.end()
+    while True:
+        position = SEPARATORS.match(buffer, position).end()
+        if position < len(buffer) and buffer[position] == "]":
+            return
+        try:
+            item, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            # The item is not complete yet, the next chunk is needed
+            chunk = next(chunks, None)
+            if chunk is None:
+                raise
+            buffer = buffer[position:] + text_decoder.decode(chunk)
+            position = 0
+        else:
+            yield item
+
+
+def is_transient(error):
+    """Returns True if a request failed because of an error which may not
+    happen again, such as an overloaded server or a network failure.
+    """
+    if isinstance(error, requests.exceptions.HTTPError):
+        return error.response.status_code in TRANSIENT_STATUSES
+    return isinstance(error, (
+        requests.exceptions.ConnectionError,
+        requests.exceptions.Timeout,
+        requests.exceptions.ChunkedEncodingError,
+        TruncatedResponseError,
+    ))
+
+
+def retry_after(error):
+    """Returns the delay in seconds requested by the Retry-After header of
+    the response of a failed request, or None.
+    """
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers["Retry-After"])
+    except (KeyError, ValueError):
+        return None
+
+
+def _tee(chunks, write):
+    """Passes chunks through, writing each one with write()."""
+    for chunk in chunks:
+        write(chunk)
+        yield chunk
 
 
 class OpenfoodfactsClient:
     """Represents an interface to the Openfoodfacts API."""
 
-    def __init__(self, lang="fr"):
+    def __init__(
+        self,
+        lang="fr",
+        max_workers=1,
+        url=None,
+        fields=PRODUCT_FIELDS,
+        cache=None,
+        rate_limit=None,
+        max_retries=3,
+        backoff=1.0,
+        timeout=30,
+        limiter=None,
+        rate_limiter=None,
+    ):
         """Client builder openfoodfacts.
 
         Args:
             lang (str): specifies the API language we want
             to access. Support "en", "fr", "world", the default value
             is "fr".
+            max_workers (int): number of pages downloaded concurrently.
+            Default value is 1, which downloads pages one after another.
+            url (str): overrides the url of the search API, for instance
+            to target a local server. Default value is None.
+            fields (iterable): product fields requested from the API and
+            kept while the responses are decoded, None keeps them all.
+            Default value is the fields required by the validators.
+            cache (ResponseCache): cache storing the downloaded pages, None
+            disables caching. Default value is None.
+            rate_limit (float): maximum number of requests sent per second,
+            None disables the limit. Default value is None.
+            max_retries (int): number of times the download of a page is
+            retried after a transient error. Default value is 3.
+            backoff (float): delay in seconds before the first retry, the
+            delay doubles at each retry. Default value is 1.
+            timeout (float): number of seconds after which an unresponsive
+            server is considered unavailable. Default value is 30.
+            limiter (AdaptiveLimiter): limiter of the simultaneous requests
+            shared with other clients of the same server, None creates one
+            allowing max_workers requests.
+            rate_limiter (TokenBucket): rate limiter shared with other
+            clients of the same server, None creates one from rate_limit.
 
         Raises:
             ValueError: if lang receives a value which is not supported.
@@ -22,10 +177,194 @@ class OpenfoodfactsClient:
         """
         if lang not in ("fr", "en", "world"):
             raise ValueError('lang supports values "fr", "en" and world"')
-        self.url = f"https://{lang}.openfoodfacts.org/cgi/search.pl"
+        if max_workers < 1:
+            raise ValueError("max_workers must be greater than 0")
+        self.lang = lang
+        self.url = url or f"https://{lang}.openfoodfacts.org/cgi/search.pl"
+        self.max_workers = max_workers
+        self.fields = fields
+        self.cache = cache
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        # Number of compressed bytes received for each downloaded page
+        self.bytes_transferred = {}
+        # Pages which could not be downloaded despite the retries
+        self.failed_pages = set()
 
-    def get_products_by_popularity(self, page_size=100, number_of_pages=1):
-        """Downloads products from openfoodfacts REST API in order of popularity
+        # The number of simultaneous requests adapts to the health of the
+        # server, without exceeding rate_limit requests per second.
+        self.limiter = limiter or AdaptiveLimiter(max_workers)
+        self.rate_limiter = rate_limiter
+        if rate_limiter is None and rate_limit is not None:
+            self.rate_limiter = TokenBucket(rate_limit)
+
+        # A single session keeps the connections alive between pages, its
+        # pool holds one connection per worker.
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers["Accept-Encoding"] = "gzip, deflate"
+
+    def _get_page(self, page, page_size, sort_by=POPULARITY):
+        """Downloads a single page of products, sorted by popularity or by
+        modification time.
+
+        Raises:
+            requests.exceptions.RequestException if the download fails.
+
+        """
+        params = {
+            "action": "process",
+            "json": True,
+            "sort_by": sort_by,
+            "page_size": page_size,
+            "page": page
+        }
+        fields = self.fields
+        if fields is not None and sort_by == LAST_MODIFIED:
+            # The synchronization needs the modification time of products
+            fields = set(fields) | {LAST_MODIFIED}
+        if fields is not None:
+            # The server only sends the fields we are interested in
+            params["fields"] = ",".join(sorted(fields))
+        # The order of the recently modified products changes all the time,
+        # it is not worth caching
+        use_cache = sort_by != LAST_MODIFIED
+        with self._open(page, params, use_cache) as chunks:
+            try:
+                return [
+                    self._select_fields(product, fields)
+                    for product in iter_json_array(chunks, "products")
+                ]
+            except json.JSONDecodeError as error:
+                raise TruncatedResponseError(str(error)) from error
+
+    @contextmanager
+    def _open(self, page, params, use_cache=True):
+        """Opens the body of the response to a request, from the cache when
+        it holds a fresh copy or when the server confirms that the cached copy
+        is still valid.
+
+        Return:
+            A context manager providing the chunks of bytes of the body.
+
+        """
+        cache = self.cache if use_cache else None
+        metadata = None
+        if cache is not None:
+            metadata = cache.get(self.url, params)
+        if metadata is not None and cache.is_fresh(metadata):
+            self.bytes_transferred[page] = 0
+            yield cache.read(self.url, params)
+            return
+
+        headers = cache.validators(metadata) if metadata else {}
+        # Only the requests actually sent to the server are throttled
+        with self.limiter.slot():
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            response = self.session.get(
+                self.url,
+                params=params,
+                headers=headers,
+                stream=True,
+                timeout=self.timeout,
+            )
+            with response:
+                if response.status_code == 304 and metadata is not None:
+                    self.limiter.on_success(response.elapsed.total_seconds())
+                    cache.refresh(self.url, params)
+                    self.bytes_transferred[page] = 0
+                    yield cache.read(self.url, params)
+                    return
+
+                response.raise_for_status()
+                self.limiter.on_success(response.elapsed.total_seconds())
+                chunks = response.iter_content(chunk_size=65536)
+                if cache is None:
+                    yield chunks
+                else:
+                    with cache.store(
+                        self.url, params, response.headers
+                    ) as write:
+                        chunks = _tee(chunks, write)
+                        yield chunks
+                        # The end of the document is cached too
+                        for chunk in chunks:
+                            pass
+                # tell() counts the bytes read from the network before they
+                # are decompressed
+                self.bytes_transferred[page] = response.raw.tell()
+
+    def _download_page(self, page, page_size, sort_by=POPULARITY):
+        """Downloads a page, retrying with an exponential backoff after
+        transient errors.
+
+        Return:
+            The list of the products of the page, or None if the page could
+            not be downloaded. The page is then added to failed_pages.
+
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self._get_page(page, page_size, sort_by)
+            except requests.exceptions.RequestException as error:
+                if not is_transient(error) or attempt == self.max_retries:
+                    break
+                self.limiter.on_overload()
+                delay = retry_after(error)
+                if delay is None:
+                    # Exponential backoff with jitter, so the workers do not
+                    # retry all at the same time
+                    delay = self.backoff * 2 ** attempt
+                    delay *= random.uniform(0.5, 1.5)
+                time.sleep(delay)
+        self.failed_pages.add(page)
+        return None
+
+    @staticmethod
+    def _select_fields(product, fields):
+        """Keeps only the interesting fields of a product."""
+        if fields is None:
+            return product
+        return {field: product[field] for field in fields if field in product}
+
+    def _iter_downloads(self, pages, get_page):
+        """Downloads pages, max_workers pages in advance.
+
+        Return:
+            A generator of (page, products) tuples in the order of the
+            pages, products being None if the page could not be downloaded.
+
+        """
+        if self.max_workers == 1:
+            for page in pages:
+                yield page, get_page(page)
+            return
+        with ThreadPoolExecutor(self.max_workers) as executor:
+            results = ordered_map(
+                executor,
+                lambda page: (page, get_page(page)),
+                pages,
+                self.max_workers,
+            )
+            try:
+                yield from results
+            finally:
+                # The pages downloaded in advance are cancelled when the
+                # caller stops early
+                results.close()
+
+    def iter_pages(self, page_size=100, number_of_pages=1, skip_pages=()):
+        """Downloads products page by page in order of popularity.
+
+        Up to max_workers pages are downloaded in advance while the caller
+        processes the current page, so only a few pages are in memory at
+        the same time. A page which cannot be downloaded despite the
+        retries is skipped and added to failed_pages, the other pages are
+        still provided.
 
         Args:
             page_size (int): number of products to download per page.
@@ -33,11 +372,13 @@ class OpenfoodfactsClient:
             Default value is 100.
             number_of_pages (int): number of pages to download.
             Default value is 1.
+            skip_pages (collection): numbers of the pages which must not be
+            downloaded, for instance because they were saved by a previous
+            run. Default value is an empty tuple.
 
         Return:
-            A list of dictionaries describing the products of openfoodfacts
-            downloaded. If a network error occurs, the returned list
-            is empty.
+            A generator of (page, products) tuples in the order of the
+            pages, products being a list of dictionaries.
 
         Raises:
             ValueError if page_size is not a supported value.
@@ -48,23 +389,242 @@ class OpenfoodfactsClient:
                 "page_size must have a value of"
                 "20, 50, 100, 250, 500, 1000"
             )
-        products = []
-        for page in range(1, number_of_pages+1):
-            params = {
-                "action": "process",
-                "json": True,
-                "sort_by": "unique_scans_n",  # popularity
-                "page_size": page_size,
-                "page": page
-            }
+        pages = [
+            page for page in range(1, number_of_pages+1)
+            if page not in skip_pages
+        ]
+        get_page = partial(self._download_page, page_size=page_size)
+        for page, products in self._iter_downloads(pages, get_page):
+            if products is not None:
+                yield page, products
+
+    def iter_modified_pages(self, since, page_size=100, max_pages=None):
+        """Downloads the products modified since a given time, page by page
+        from the most recently modified.
+
+        The download stops at the first page holding a product modified
+        before since. A product modified during the download moves to the
+        first page and may be missed, but it is then modified after the
+        time of the most recent product of the first page, from which the
+        next synchronization starts. The products moving to the following
+        pages in the meantime may be provided twice.
+
+        Args:
+            since (int): UNIX time, only the products whose last_modified_t
+            is at least since are provided.
+            page_size (int): number of products to download per page.
+            Default value is 100.
+            max_pages (int): maximum number of pages to download, None
+            downloads every modified product. The download stops at the
+            first page which cannot be downloaded.
+
+        Return:
+            A generator of (page, products) tuples, the products keeping
+            their last_modified_t field.
+
+        """
+        pages = count(1) if max_pages is None else range(1, max_pages + 1)
+        get_page = partial(
+            self._download_page, page_size=page_size, sort_by=LAST_MODIFIED
+        )
+        for page, products in self._iter_downloads(pages, get_page):
+            if products is None:
+                # The following pages cannot be trusted to end the sync, it
+                # stops there and the failure is reported by failed_pages
+                return
+            modified_products = [
+                product for product in products
+                if product.get(LAST_MODIFIED, 0) >= since
+            ]
+            if modified_products:
+                yield page, modified_products
+            if len(modified_products) < page_size:
+                return
+
+    def iter_products(self, page_size=100, number_of_pages=1):
+        """Downloads products one page at a time in order of popularity.
+
+        Args:
+            page_size (int): number of products to download per page.
+            The supported values are 20, 50, 100, 250, 500, 1000.
+            Default value is 100.
+            number_of_pages (int): number of pages to download.
+            Default value is 1.
+
+        Return:
+            A generator of dictionaries describing the products of
+            openfoodfacts. The products of the pages which cannot be
+            downloaded are missing.
+
+        Raises:
+            ValueError if page_size is not a supported value.
+
+        """
+        for page, products in self.iter_pages(page_size, number_of_pages):
+            yield from products
+
+    def get_products_by_popularity(self, page_size=100, number_of_pages=1):
+        """Downloads products from openfoodfacts REST API in order of popularity
+
+        Pages are downloaded by max_workers concurrent requests, the
+        products are nevertheless returned in the order of the pages.
+
+        Args:
+            page_size (int): number of products to download per page.
+            The supported values are 20, 50, 100, 250, 500, 1000.
+            Default value is 100.
+            number_of_pages (int): number of pages to download.
+            Default value is 1.
+
+        Return:
+            A list of dictionaries describing the products of openfoodfacts
+            downloaded. The products of the pages which cannot be
+            downloaded are missing, the numbers of these pages are listed
+            in failed_pages.
+
+        Raises:
+            ValueError if page_size is not a supported value.
+
+        """
+        return list(self.iter_products(page_size, number_of_pages))
+
+
+class OpenfoodfactsMultiClient:
+    """Downloads products from several openfoodfacts endpoints at once."""
+
+    def __init__(self, langs=("fr", "en", "world"), queue_size=2, **options):
+        """Initializes a client per endpoint.
+
+        Args:
+            langs (iterable): languages of the endpoints, in order of
+            preference. Default value is ("fr", "en", "world").
+            queue_size (int): number of pages of an endpoint downloaded in
+            advance while the pages of the preferred endpoints are being
+            processed. Default value is 2.
+            options: arguments given to every OpenfoodfactsClient.
+
+        """
+        # The endpoints are served by the same servers, so the clients share
+        # the limits on the requests instead of multiplying them
+        rate_limit = options.pop("rate_limit", None)
+        options.setdefault(
+            "limiter", AdaptiveLimiter(options.get("max_workers", 1))
+        )
+        if rate_limit is not None:
+            options.setdefault("rate_limiter", TokenBucket(rate_limit))
+        self.clients = [
+            OpenfoodfactsClient(lang=lang, **options) for lang in langs
+        ]
+        self.queue_size = queue_size
+
+    @property
+    def bytes_transferred(self):
+        """Number of compressed bytes received for each downloaded page,
+        the pages being named "lang:page".
+        """
+        return {
+            f"{client.lang}:{page}": size
+            for client in self.clients
+            for page, size in client.bytes_transferred.items()
+        }
+
+    @property
+    def failed_pages(self):
+        """Pages which could not be downloaded, named "lang:page"."""
+        return {
+            f"{client.lang}:{page}"
+            for client in self.clients
+            for page in client.failed_pages
+        }
+
+    @staticmethod
+    def _put(pages, item, stop):
+        """Puts an item in a queue, unless the consumer has stopped.
+
+        Return:
+            False if the consumer has stopped.
+
+        """
+        while not stop.is_set():
             try:
-                response = requests.get(self.url, params=params)
-                response.raise_for_status()
-            except requests.exceptions.Request:
-                return []  # In the event of an error, an empty list is returned
+                pages.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _produce(self, client, pages, stop, *args):
+        """Downloads the pages of an endpoint into a queue, followed by None
+        or by the exception which interrupted the download.
+        """
+        try:
+            for item in client.iter_pages(*args):
+                if not self._put(pages, item, stop):
+                    return
+        except Exception as error:
+            self._put(pages, error, stop)
+        else:
+            self._put(pages, None, stop)
+
+    def iter_pages(self, page_size=100, number_of_pages=1, skip_pages=()):
+        """Downloads products page by page from every endpoint at once.
+
+        The pages of each endpoint are provided after those of the
+        endpoints preferred over it, so that a product present on several
+        endpoints is first seen in its preferred version. The endpoints are
+        nevertheless downloaded concurrently, each one queue_size pages in
+        advance.
+
+        Args:
+            page_size (int): number of products to download per page.
+            number_of_pages (int): number of pages to download per endpoint.
+            skip_pages (collection): pages which must not be downloaded,
+            named "lang:page".
+
+        Return:
+            A generator of (page, products) tuples, page being named
+            "lang:page".
+
+        """
+        stop = threading.Event()
+        queues = []
+        threads = []
+        for client in self.clients:
+            pages = queue.Queue(maxsize=self.queue_size)
+            client_skip_pages = {
+                int(name.split(":")[1]) for name in skip_pages
+                if str(name).startswith(f"{client.lang}:")
+            }
+            thread = threading.Thread(
+                target=self._produce,
+                args=(
+                    client, pages, stop, page_size, number_of_pages,
+                    client_skip_pages,
+                ),
+                daemon=True,
+            )
+            thread.start()
+            queues.append(pages)
+            threads.append(thread)
 
-            data = response.json().get("products")
-            if data is not None:
-                products.extend(data)
+        try:
+            for client, pages in zip(self.clients, queues):
+                while True:
+                    item = pages.get()
+                    if item is None:
+                        break
+                    if isinstance(item, Exception):
+                        raise item
+                    page, products = item
+                    yield f"{client.lang}:{page}", products
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
 
-        return products
+    def iter_products(self, page_size=100, number_of_pages=1):
+        """Downloads products from every endpoint at once, the products of
+        the preferred endpoints coming first.
+        """
+        for page, products in self.iter_pages(page_size, number_of_pages):
+            yield from products
@@ -141,7 +141,8 @@ class Application:
 
     def favorite_list_menu(self):
         """Manages the menu displaying the list of favorites."""
-        favorites = Favorite.manager.get_all()
+        # The products of all the favorites are retrieved by a single query
+        favorites = Favorite.manager.get_all(prefetch=["products"])
         if len(favorites) > 0:
             print("\nHere are the favorites you have saved\n")
         else:
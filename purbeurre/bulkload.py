@@ -0,0 +1,367 @@
+"""This module fills the empty tables of the database with LOAD DATA LOCAL
+INFILE, which is the fastest way to install a whole catalog.
+
+The normalized products are written to temporary files in the text format
+read by LOAD DATA and each table is then loaded with a single statement.
+The names of the categories and stores are loaded as they are, the UNIQUE
+index merging those equal for the collation of the table, and the
+associations are built by joining the staged (product_id, name) pairs on
+the loaded names, so MySQL alone decides which names are the same.
+"""
+
+import os
+import shutil
+import tempfile
+
+from purbeurre.database import connection, transaction
+from purbeurre.models import (
+    Product,
+    Category,
+    Store,
+    ProductCategory,
+    ProductStore,
+)
+from purbeurre.validators import BarcodeSet
+
+# Tables filled by the load, the referenced ones first
+MODELS = (Product, Category, Store, ProductCategory, ProductStore)
+
+
+class BulkLoadError(Exception):
+    """Error raised when the loaded tables do not pass the checks done once
+    the constraints are enabled again.
+    """
+
+    def __init__(self, problems):
+        """Initializes the error from the problems found.
+
+        Args:
+            problems (dict): number of faulty rows by description.
+
+        """
+        self.problems = problems
+        super().__init__(
+            "the bulk load left faulty rows: " + ", ".join(
+                f"{count} {problem}" for problem, count in problems.items()
+            )
+        )
+
+
+def escape(value):
+    """Formats a value for the default text format of LOAD DATA, where
+    tabulations separate the fields, lines separate the rows and \\N is NULL.
+    """
+    if value is None:
+        return "\\N"
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+        .replace("\0", "\\0")
+    )
+
+
+class _TableFile:
+    """Temporary file holding the rows loaded into a table."""
+
+    def __init__(self, directory, model, columns, table=None):
+        self.model = model
+        self.table = table or model.table
+        self.columns = columns
+        self.path = os.path.join(directory, f"{self.table}.tsv")
+        self.rows = 0
+        self._file = open(self.path, "w", encoding="utf-8", newline="\n")
+
+    def write(self, *values):
+        self._file.write("\t".join(escape(value) for value in values) + "\n")
+        self.rows += 1
+
+    def close(self):
+        self._file.close()
+
+
+class BulkLoader:
+    """Object collecting normalized products and loading them into empty
+    tables with LOAD DATA LOCAL INFILE.
+
+    The MySQL server must accept local files, with local_infile=ON.
+    """
+
+    def __init__(self, directory=None):
+        """Creates the temporary files of the tables.
+
+        Args:
+            directory (str): directory of the temporary files, None uses the
+            temporary directory of the system.
+
+        """
+        self.directory = tempfile.mkdtemp(prefix="purbeurre-", dir=directory)
+        self._files = {
+            "products": _TableFile(
+                self.directory,
+                Product,
+                ("id", "name", "url", "nutriscore", "description"),
+            ),
+            "categories": _TableFile(self.directory, Category, ("name",)),
+            "stores": _TableFile(self.directory, Store, ("name",)),
+            # Staging tables of the associations, joined on the names
+            "product_categories": _TableFile(
+                self.directory,
+                ProductCategory,
+                ("product_id", "name"),
+                f"{ProductCategory.table}_names",
+            ),
+            "product_stores": _TableFile(
+                self.directory,
+                ProductStore,
+                ("product_id", "name"),
+                f"{ProductStore.table}_names",
+            ),
+        }
+        self._barcodes = BarcodeSet()
+        self._category_names = set()
+        self._store_names = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @staticmethod
+    def _add_names(product_id, names, seen_names, names_file, staging_file):
+        """Writes the categories or stores of a product, each name being
+        written once in names_file whatever the number of its products.
+        """
+        for name in {name[:100] for name in names}:
+            if name not in seen_names:
+                seen_names.add(name)
+                names_file.write(name)
+            staging_file.write(product_id, name)
+
+    def add(self, product_info):
+        """Writes the rows of a normalized product, its categories and its
+        stores.
+
+        Return:
+            False if a product with the same barcode has already been added.
+
+        """
+        if not self._barcodes.add(product_info["id"]):
+            return False
+        product = Product(**{
+            field: value for field, value in product_info.items()
+            if field not in ("categories", "stores")
+        })
+        self._files["products"].write(
+            product.id,
+            product.name,
+            product.url,
+            product.nutriscore,
+            product.description,
+        )
+        self._add_names(
+            product.id,
+            product_info["categories"],
+            self._category_names,
+            self._files["categories"],
+            self._files["product_categories"],
+        )
+        self._add_names(
+            product.id,
+            product_info["stores"],
+            self._store_names,
+            self._files["stores"],
+            self._files["product_stores"],
+        )
+        return True
+
+    def add_all(self, products):
+        """Writes the rows of normalized products."""
+        for product_info in products:
+            self.add(product_info)
+
+    def check_empty(self):
+        """Raises ValueError if one of the tables already holds rows, since
+        a failed load empties them.
+        """
+        with connection() as db:
+            cursor = db.cursor()
+            for model in MODELS:
+                cursor.execute(f"SELECT 1 FROM {model.table} LIMIT 1")
+                if cursor.fetchall():
+                    cursor.close()
+                    raise ValueError(
+                        f"the table {model.table} must be empty to be "
+                        f"bulk loaded"
+                    )
+            cursor.close()
+
+    @staticmethod
+    def _load_file(cursor, table_file, ignore=False):
+        """Loads a temporary file into its table.
+
+        Return:
+            The number of rows loaded.
+
+        """
+        cursor.execute(
+            f"LOAD DATA LOCAL INFILE %s "
+            f"{'IGNORE ' if ignore else ''}INTO TABLE {table_file.table} "
+            f"CHARACTER SET utf8mb4 "
+            f"({', '.join(table_file.columns)})",
+            (table_file.path,),
+        )
+        return cursor.rowcount
+
+    def _load_association(self, cursor, names_file, staging_file, column):
+        """Loads the names of the categories or stores, then builds their
+        association table from the staged (product_id, name) pairs.
+
+        Return:
+            A (loaded_names, loaded_associations, unknown_names) tuple, the
+            last item counting the staged pairs whose name was not loaded.
+
+        """
+        named = names_file.table
+        staging = staging_file.table
+        association = staging_file.model.table
+        # Names equal for the collation of the table are skipped by IGNORE
+        loaded_names = self._load_file(cursor, names_file, ignore=True)
+        # The name column is copied from the loaded table, collation included
+        cursor.execute(
+            f"CREATE TEMPORARY TABLE {staging} "
+            f"(product_id BIGINT NOT NULL) "
+            f"SELECT name FROM {named} LIMIT 0"
+        )
+        try:
+            self._load_file(cursor, staging_file)
+            cursor.execute(
+                f"INSERT INTO {association} (product_id, {column}) "
+                f"SELECT DISTINCT {staging}.product_id, {named}.id "
+                f"FROM {staging} "
+                f"JOIN {named} ON {named}.name = {staging}.name"
+            )
+            loaded_associations = cursor.rowcount
+            cursor.execute(
+                f"SELECT COUNT(*) FROM {staging} "
+                f"LEFT JOIN {named} ON {named}.name = {staging}.name "
+                f"WHERE {named}.id IS NULL"
+            )
+            unknown_names = cursor.fetchone()[0]
+        finally:
+            cursor.execute(f"DROP TEMPORARY TABLE IF EXISTS {staging}")
+        return loaded_names, loaded_associations, unknown_names
+
+    def load(self):
+        """Loads the rows into the tables.
+
+        The foreign key checks are disabled during the load, then the
+        tables are checked. If faulty rows are found the tables are emptied
+        again.
+
+        Return:
+            A dictionary giving the number of rows loaded by table.
+
+        Raises:
+            ValueError if one of the tables is not empty.
+            BulkLoadError if the loaded rows break a constraint.
+
+        """
+        self.check_empty()
+        for table_file in self._files.values():
+            table_file.close()
+
+        products = self._files["products"]
+        loaded_rows = {}
+        problems = {}
+        with transaction() as db:
+            cursor = db.cursor()
+            # The unique checks stay enabled, the UNIQUE index of the names
+            # merging those equal for the collation
+            cursor.execute("SET foreign_key_checks = 0")
+            try:
+                loaded_rows[products.table] = self._load_file(
+                    cursor, products
+                )
+                for names, staging, column in (
+                    ("categories", "product_categories", "category_id"),
+                    ("stores", "product_stores", "store_id"),
+                ):
+                    names_file = self._files[names]
+                    staging_file = self._files[staging]
+                    (
+                        loaded_rows[names_file.table],
+                        loaded_rows[staging_file.model.table],
+                        unknown_names,
+                    ) = self._load_association(
+                        cursor, names_file, staging_file, column
+                    )
+                    if unknown_names:
+                        problems[
+                            f"unknown names in {staging_file.table}"
+                        ] = unknown_names
+            finally:
+                cursor.execute("SET foreign_key_checks = 1")
+                cursor.close()
+        # The ids written by the load are not those cached by the managers
+        Category.manager.ids.clear()
+        Store.manager.ids.clear()
+
+        problems.update(self.validate())
+        skipped_rows = products.rows - loaded_rows[products.table]
+        if skipped_rows:
+            problems[f"rows skipped in {products.table}"] = skipped_rows
+        if problems:
+            # The associations are deleted before the rows they reference
+            for model in reversed(MODELS):
+                model.manager.delete_all()
+            raise BulkLoadError(problems)
+        return loaded_rows
+
+    def validate(self):
+        """Checks the constraints which were not enforced during the load.
+
+        Return:
+            A dictionary giving the number of faulty rows by problem, empty
+            if the tables are sound.
+
+        """
+        product = Product.table
+        checks = {}
+        for association, named, column in (
+            (ProductCategory.table, Category.table, "category_id"),
+            (ProductStore.table, Store.table, "store_id"),
+        ):
+            checks[f"orphan rows in {association}"] = (
+                f"SELECT COUNT(*) FROM {association} "
+                f"LEFT JOIN {product} "
+                f"ON {product}.id = {association}.product_id "
+                f"LEFT JOIN {named} "
+                f"ON {named}.id = {association}.{column} "
+                f"WHERE {product}.id IS NULL OR {named}.id IS NULL"
+            )
+            checks[f"duplicate names in {named}"] = (
+                f"SELECT COUNT(*) FROM ("
+                f"SELECT name FROM {named} GROUP BY name HAVING COUNT(*) > 1"
+                f") AS duplicates"
+            )
+
+        problems = {}
+        with connection() as db:
+            cursor = db.cursor()
+            for problem, query in checks.items():
+                cursor.execute(query)
+                count = cursor.fetchone()[0]
+                if count:
+                    problems[problem] = count
+            cursor.close()
+        return problems
+
+    def close(self):
+        """Removes the temporary files."""
+        for table_file in self._files.values():
+            table_file.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
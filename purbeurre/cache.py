@@ -0,0 +1,253 @@
+"""This module contains the caches used to avoid repeating costly
+operations.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class ResponseCache:
+    """Compressed on-disk cache of HTTP responses.
+
+    Each response is stored in two files named after a hash of its url and
+    parameters: the gzip-compressed body and a small JSON file holding its
+    metadata (storage date, ETag and Last-Modified headers).
+    """
+
+    def __init__(self, directory, ttl=86400, max_size=500 * 1024 ** 2):
+        """Initializes a new cache.
+
+        Args:
+            directory (str): directory where the responses are stored. It is
+            created if necessary.
+            ttl (int): number of seconds during which a response is fresh and
+            can be used without contacting the server. Default value is one
+            day.
+            max_size (int): maximum size of the cache in bytes, the least
+            recently used responses are evicted beyond it. Default value
+            is 500MB.
+
+        """
+        self.directory = directory
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, url, params, extension):
+        """Returns the path of a file of the entry matching url and params."""
+        key = json.dumps([url, sorted((params or {}).items())], default=str)
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return os.path.join(self.directory, f"{digest}.{extension}")
+
+    def get(self, url, params=None):
+        """Retrieves the metadata of a cached response.
+
+        Return:
+            A dictionary holding the "stored_at", "etag" and "last_modified"
+            keys, or None if the response is not in the cache.
+
+        """
+        try:
+            with open(self._path(url, params, "meta")) as file:
+                metadata = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if not os.path.exists(self._path(url, params, "gz")):
+            return None
+        return metadata
+
+    def is_fresh(self, metadata):
+        """Returns True if a cached response can be used as is."""
+        return time.time() - metadata["stored_at"] < self.ttl
+
+    def validators(self, metadata):
+        """Builds the headers of a conditional request revalidating a cached
+        response.
+        """
+        headers = {}
+        if metadata.get("etag"):
+            headers["If-None-Match"] = metadata["etag"]
+        if metadata.get("last_modified"):
+            headers["If-Modified-Since"] = metadata["last_modified"]
+        return headers
+
+    def read(self, url, params=None, chunk_size=65536):
+        """Reads the decompressed body of a cached response.
+
+        Return:
+            A generator of chunks of bytes.
+
+        """
+        path = self._path(url, params, "gz")
+        # The modification date of the body tracks its last use
+        os.utime(path)
+        with gzip.open(path, "rb") as file:
+            while True:
+                chunk = file.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+    def refresh(self, url, params=None):
+        """Marks a cached response as fresh again, after the server has
+        confirmed it did not change.
+        """
+        metadata = self.get(url, params)
+        if metadata is not None:
+            metadata["stored_at"] = time.time()
+            self._write_metadata(url, params, metadata)
+
+    def _write_metadata(self, url, params, metadata):
+        path = self._path(url, params, "meta")
+        fd, temporary_path = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, "w") as file:
+            json.dump(metadata, file)
+        os.replace(temporary_path, path)
+
+    @contextmanager
+    def store(self, url, params=None, headers=None):
+        """Stores a response in the cache as it is received.
+
+        The body is compressed in a temporary file and only replaces the
+        cached one when the block ends without error.
+
+        Args:
+            url (str): url of the request.
+            params (dict): parameters of the request.
+            headers (dict): headers of the response.
+
+        Return:
+            A context manager providing a function writing a chunk of the
+            body.
+
+        """
+        headers = headers or {}
+        fd, temporary_path = tempfile.mkstemp(dir=self.directory)
+        try:
+            with os.fdopen(fd, "wb") as raw_file, gzip.GzipFile(
+                fileobj=raw_file, mode="wb", compresslevel=6
+            ) as file:
+                yield file.write
+            os.replace(temporary_path, self._path(url, params, "gz"))
+        except BaseException:
+            os.remove(temporary_path)
+            raise
+        self._write_metadata(url, params, {
+            "url": url,
+            "stored_at": time.time(),
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+        })
+        self.evict()
+
+    def evict(self):
+        """Removes the stale responses which cannot be revalidated, then the
+        least recently used responses until the size of the cache is below
+        max_size.
+        """
+        with self._lock:
+            entries = []
+            size = 0
+            for entry in os.scandir(self.directory):
+                if not entry.name.endswith(".gz"):
+                    continue
+                metadata_path = entry.path[:-len("gz")] + "meta"
+                try:
+                    with open(metadata_path) as file:
+                        metadata = json.load(file)
+                    stat = entry.stat()
+                except (OSError, ValueError):
+                    continue
+                if not self.is_fresh(metadata) and not self.validators(
+                    metadata
+                ):
+                    self._remove(entry.path)
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                size += stat.st_size
+
+            entries.sort()
+            while entries and size > self.max_size:
+                mtime, file_size, path = entries.pop(0)
+                self._remove(path)
+                size -= file_size
+
+    def _remove(self, path):
+        """Removes the body stored at path and its metadata."""
+        for file_path in (path, path[:-len("gz")] + "meta"):
+            try:
+                os.remove(file_path)
+            except FileNotFoundError:
+                pass
+
+    def clear(self):
+        """Removes every response from the cache."""
+        with self._lock:
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith((".gz", ".meta")):
+                    os.remove(entry.path)
+
+
+class LRUCache:
+    """In-memory cache holding at most max_size items, the least recently
+    used ones being evicted first.
+    """
+
+    def __init__(self, max_size):
+        """Initializes an empty cache.
+
+        Args:
+            max_size (int): maximum number of items in the cache.
+
+        """
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get(self, key, default=None):
+        """Returns the value of key, or default if it is not in the cache."""
+        with self._lock:
+            try:
+                value = self._items[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """Stores the value of key, evicting the least recently used item if
+        the cache is full.
+        """
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            if len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def pop(self, key):
+        """Removes key from the cache if it is present."""
+        with self._lock:
+            self._items.pop(key, None)
+
+    def clear(self):
+        """Removes every item from the cache."""
+        with self._lock:
+            self._items.clear()
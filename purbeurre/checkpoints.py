@@ -0,0 +1,197 @@
+"""This module records the progress of the installation so that an
+interrupted installation can be resumed.
+"""
+
+import json
+import os
+
+
+class InstallCheckpoint:
+    """Journal of the pages and products already saved in the database.
+
+    Each step is appended as a line of JSON to the journal file, so
+    recording a step is cheap and an interruption can at worst lose the
+    last, incomplete, line.
+    """
+
+    def __init__(self, path, page_size=None):
+        """Opens the journal stored at path, reloading its content.
+
+        Args:
+            path (str): path of the journal file.
+            page_size (int): size of the pages of the installation. The
+            pages recorded with a different page size are forgotten since
+            they do not contain the same products.
+
+        """
+        self.path = path
+        self.page_size = page_size
+        self.pages = set()
+        self.products = set()
+        self.pending_products = set()
+        self._file = None
+        self._load()
+        if self._recorded_page_size != page_size:
+            self.pages.clear()
+            if os.path.exists(path):
+                self._append({"page_size": page_size})
+
+    def _load(self):
+        """Replays the records of the journal."""
+        self._recorded_page_size = None
+        try:
+            with open(self.path) as file:
+                lines = file.readlines()
+        except FileNotFoundError:
+            return
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # Line cut by an interruption
+            if "page_size" in record:
+                # The pages recorded before belong to another page size
+                if record["page_size"] != self._recorded_page_size:
+                    self.pages.clear()
+                self._recorded_page_size = record["page_size"]
+            elif "page" in record:
+                self.pages.add(record["page"])
+            elif "pending" in record:
+                self.pending_products.add(record["pending"])
+            elif "product" in record:
+                self.products.add(record["product"])
+                self.pending_products.discard(record["product"])
+            elif "pending_batch" in record:
+                self.pending_products.update(record["pending_batch"])
+            elif "batch" in record:
+                self.products.update(record["batch"])
+                self.pending_products.difference_update(record["batch"])
+
+    def _append(self, record, sync=False):
+        """Appends a record to the journal."""
+        if self._file is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            new = not os.path.exists(self.path)
+            cut = not new and not self._ends_with_newline()
+            self._file = open(self.path, "a")
+            if cut:
+                # Ends the line cut by an interruption, so that the next
+                # record is not glued to it
+                self._file.write("\n")
+            if new:
+                # Every journal starts with the page size of its pages
+                self._file.write(json.dumps({"page_size": self.page_size}))
+                self._file.write("\n")
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        if sync:
+            os.fsync(self._file.fileno())
+
+    def _ends_with_newline(self):
+        """Returns True if the journal is empty or ends with a newline."""
+        with open(self.path, "rb") as file:
+            file.seek(0, os.SEEK_END)
+            if not file.tell():
+                return True
+            file.seek(-1, os.SEEK_END)
+            return file.read(1) == b"\n"
+
+    @property
+    def resumed(self):
+        """True if the journal holds steps of a previous installation."""
+        return bool(self.pages or self.products or self.pending_products)
+
+    def is_page_done(self, page):
+        """Returns True if every product of page has been saved."""
+        return page in self.pages
+
+    def is_product_saved(self, product_id):
+        """Returns True if a product and its associations have been saved."""
+        return product_id in self.products
+
+    def is_product_pending(self, product_id):
+        """Returns True if the saving of a product has been interrupted."""
+        return product_id in self.pending_products
+
+    def mark_product_pending(self, product_id):
+        """Records that a product is about to be saved."""
+        self._append({"pending": product_id})
+
+    def mark_product_saved(self, product_id):
+        """Records that a product and its associations have been saved."""
+        self.products.add(product_id)
+        self.pending_products.discard(product_id)
+        self._append({"product": product_id})
+
+    def mark_products_pending(self, product_ids):
+        """Records that a batch of products is about to be saved."""
+        self._append({"pending_batch": list(product_ids)})
+
+    def mark_products_saved(self, product_ids):
+        """Records that a batch of products and their associations have been
+        saved.
+        """
+        self.products.update(product_ids)
+        self.pending_products.difference_update(product_ids)
+        self._append({"batch": list(product_ids)})
+
+    def mark_page_done(self, page):
+        """Records that every product of a page has been saved."""
+        self.pages.add(page)
+        self._append({"page": page}, sync=True)
+
+    def close(self):
+        """Closes the journal file."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def clear(self):
+        """Forgets every step, once the installation is complete."""
+        self.close()
+        self.pages.clear()
+        self.products.clear()
+        self.pending_products.clear()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class SyncState:
+    """High-water marks of the synchronizations, that is the modification
+    time from which the next synchronization of each endpoint starts.
+    """
+
+    def __init__(self, path):
+        """Loads the marks stored at path.
+
+        Args:
+            path (str): path of the JSON file holding the marks.
+
+        """
+        self.path = path
+        try:
+            with open(path) as file:
+                self.marks = json.load(file)
+        except (FileNotFoundError, ValueError):
+            self.marks = {}
+
+    def get(self, endpoint):
+        """Returns the mark of an endpoint, None if it was never synced."""
+        return self.marks.get(endpoint)
+
+    def set(self, endpoint, mark):
+        """Records the mark of an endpoint and saves the marks."""
+        self.marks[endpoint] = mark
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # The marks are replaced at once, so an interruption keeps the
+        # previous ones
+        temporary_path = f"{self.path}.tmp"
+        with open(temporary_path, "w") as file:
+            json.dump(self.marks, file)
+        os.replace(temporary_path, self.path)
@@ -0,0 +1,35 @@
+"""Helpers to run tasks concurrently without loading every result in
+memory.
+"""
+
+from collections import deque
+
+
+def ordered_map(executor, function, iterable, window):
+    """Lazy equivalent of executor.map().
+
+    Contrary to executor.map(), which submits every task at once, at most
+    window tasks are submitted in advance, so only window results are held
+    in memory while the consumer is busy.
+
+    Args:
+        executor (concurrent.futures.Executor): executor running the tasks.
+        function (callable): function applied to each item.
+        iterable (iterable): items passed to function.
+        window (int): maximum number of tasks submitted in advance.
+
+    Return:
+        A generator of the results, in the order of the items.
+
+    """
+    futures = deque()
+    try:
+        for item in iterable:
+            futures.append(executor.submit(function, item))
+            if len(futures) >= window:
+                yield futures.popleft().result()
+        while futures:
+            yield futures.popleft().result()
+    finally:
+        for future in futures:
+            future.cancel()
@@ -1,8 +1,180 @@
-from mysql.connector import MySQLConnection
+import queue
+import threading
+import time
+import weakref
+from contextlib import contextmanager
 
 import settings
 
-db = MySQLConnection(
+
+class ConnectionPool:
+    """Pool of connections to the database shared by the threads.
+
+    Each thread gets its own connection with the connection() context
+    manager, and keeps it in the nested blocks, so that the session
+    settings and the transaction of a thread are never seen by another
+    one. The connections are opened on demand, up to the size of the pool,
+    and those which stayed idle for a while are checked before being
+    handed out again.
+    """
+
+    def __init__(self, size, timeout=None, ping_interval=0, **options):
+        """Initializes a pool without opening any connection.
+
+        Args:
+            size (int): maximum number of connections opened at once.
+            timeout (float): maximum number of seconds waited for a free
+            connection, None waits forever.
+            ping_interval (float): number of seconds a connection can stay
+            idle without being checked before being handed out. Default
+            value is 0, always checking it.
+            options: arguments of the MySQLConnection of the pool.
+
+        """
+        self.size = size
+        self.timeout = timeout
+        self.ping_interval = ping_interval
+        self.options = options
+        self._idle = queue.Queue(size)
+        self._opened = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _connect(self):
+        """Opens a connection already counted in the opened ones."""
+        from mysql.connector import MySQLConnection
+
+        try:
+            return MySQLConnection(**self.options)
+        except BaseException:
+            with self._lock:
+                self._opened -= 1
+            raise
+
+    @staticmethod
+    def _is_healthy(connection):
+        """Returns True if the server still answers on the connection."""
+        from mysql.connector import Error
+
+        try:
+            connection.ping(reconnect=False)
+        except Error:
+            return False
+        return True
+
+    def acquire(self):
+        """Takes a connection out of the pool, opening it if necessary.
+
+        Raises:
+            TimeoutError if every connection is still used after the timeout
+            of the pool.
+
+        """
+        try:
+            connection, released_at = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_open = self._opened < self.size
+                if can_open:
+                    self._opened += 1
+            if can_open:
+                return self._connect()
+            try:
+                connection, released_at = self._idle.get(timeout=self.timeout)
+            except queue.Empty:
+                raise TimeoutError(
+                    f"no connection released after {self.timeout} s"
+                ) from None
+
+        idle_time = time.monotonic() - released_at
+        if idle_time < self.ping_interval or self._is_healthy(connection):
+            return connection
+        # The server closed the connection, it is replaced by a new one
+        self._discard(connection)
+        return self._connect()
+
+    @staticmethod
+    def _discard(connection):
+        """Closes a connection, even if the server already closed it."""
+        from mysql.connector import Error
+
+        try:
+            connection.close()
+        except Error:
+            pass
+
+    def release(self, connection):
+        """Gives a connection back to the pool, rolling back what it left
+        uncommitted.
+        """
+        from mysql.connector import Error
+
+        try:
+            if connection.in_transaction:
+                connection.rollback()
+        except Error:
+            # A broken connection is replaced at the next health check
+            pass
+        self._idle.put((connection, time.monotonic()))
+
+    @contextmanager
+    def connection(self):
+        """Context manager giving the connection of the current thread,
+        taken out of the pool in the outermost block and released at its
+        end.
+        """
+        local = self._local
+        if getattr(local, "connection", None) is not None:
+            yield local.connection
+            return
+        local.connection = self.acquire()
+        try:
+            yield local.connection
+        finally:
+            connection, local.connection = local.connection, None
+            self.release(connection)
+
+    @contextmanager
+    def transaction(self):
+        """Context manager giving the connection of the current thread,
+        committed at the end of the outermost transaction block or rolled
+        back if it fails. The nested blocks join the outer transaction.
+        """
+        with self.connection() as connection:
+            local = self._local
+            if getattr(local, "transaction", False):
+                yield connection
+                return
+            local.transaction = True
+            try:
+                yield connection
+                connection.commit()
+            except BaseException:
+                connection.rollback()
+                raise
+            finally:
+                local.transaction = False
+
+    def in_transaction(self):
+        """Returns True in a transaction block of the current thread."""
+        return getattr(self._local, "transaction", False)
+
+    def close(self):
+        """Closes the idle connections."""
+        while True:
+            try:
+                connection, released_at = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            with self._lock:
+                self._opened -= 1
+            self._discard(connection)
+
+
+pool = ConnectionPool(
+    settings.DB_POOL_SIZE,
+    timeout=settings.DB_POOL_TIMEOUT,
+    ping_interval=settings.DB_POOL_PING_INTERVAL,
     user=settings.DB_USER,
     password=settings.DB_PASSWORD,
     database=settings.DB_NAME,
@@ -10,8 +182,70 @@ db = MySQLConnection(
     port=settings.DB_PORT,
     charset=settings.DB_CHARSET,
     collation=settings.DB_COLLATION,
+    # Needed by LOAD DATA LOCAL INFILE, see purbeurre.bulkload
+    allow_local_infile=True,
 )
 
+
+def connection():
+    """Context manager giving the connection of the current thread.
+
+    Example:
+        with connection() as db:
+            cursor = db.cursor()
+
+    """
+    return pool.connection()
+
+
+@contextmanager
+def transaction():
+    """Context manager making the manager calls of the block a single unit
+    of work, committed at the end of the block or rolled back if it fails.
+
+    The writes of the managers run in a transaction of their own, or join
+    the one of an enclosing block. The statements creating, altering or
+    dropping tables are committed at once by MySQL, even in a block.
+
+    It can also decorate a function, each call running in a transaction.
+
+    Example:
+        with transaction():
+            product = Product.manager.create(**product_info)
+            product.add_categories(*categories)
+
+    """
+    try:
+        with pool.transaction() as db:
+            yield db
+    except BaseException:
+        if not pool.in_transaction():
+            # The rows cached during the block may have been rolled back
+            for manager in _managers:
+                manager.clear_cache()
+        raise
+
+
+# Server-side prepared statements of each connection, by query
+_prepared_cursors = weakref.WeakKeyDictionary()
+_prepared_cursors_lock = threading.Lock()
+
+
+def prepared_cursor(db, query):
+    """Returns the cursor of the connection db which prepared query, so that
+    the server parses the query once per connection.
+
+    The cursor keeps its prepared statement as long as it executes the same
+    query object with positional parameters.
+    """
+    with _prepared_cursors_lock:
+        cursors = _prepared_cursors.setdefault(db, {})
+    cursor = cursors.get(query)
+    if cursor is None:
+        cursor = cursors[query] = db.cursor(prepared=True)
+    return cursor
+
+
 _managers = []
 
 
@@ -20,13 +254,46 @@ def register_manager(manager):
     _managers.append(manager)
 
 
-def create_tables():
-    """Create the database tables if necessary."""
+def create_tables(constraints=True):
+    """Create the database tables if necessary.
+
+    Args:
+        constraints (bool): False creates the tables without their keys and
+        foreign keys, so that they are filled faster. create_constraints()
+        must be called once they are filled. Default value is True.
+
+    """
     import purbeurre.models
 
     for manager in _managers:
         print(f"Creating table {manager.table}")
-        manager.create_table()
+        manager.create_table(constraints)
+
+
+def create_constraints():
+    """Creates the keys and foreign keys of the tables created without them,
+    once they are filled.
+
+    The constraints of a table are only created if none of its rows violate
+    them.
+
+    Return:
+        A dictionary giving, for each table whose constraints could not be
+        created, the number of faulty rows by constraint.
+
+    """
+    import purbeurre.models
+
+    problems = {}
+    for manager in _managers:
+        violations = manager.find_violations()
+        if violations:
+            problems[manager.table] = violations
+            continue
+        if manager.constraints:
+            print(f"Creating the constraints of {manager.table}")
+            manager.create_constraints()
+    return problems
 
 
 def drop_tables():
@@ -36,3 +303,111 @@ def drop_tables():
     for manager in reversed(_managers):
         print(f"Dropping table {manager.table}")
         manager.drop_table()
+
+
+def _set_tables(tables):
+    """Points the managers and their models to the given tables.
+
+    Args:
+        tables (dict): name of the table of each manager.
+
+    """
+    for manager, table in tables.items():
+        manager.table = table
+        manager.model.table = table
+        manager.clear_cache()
+
+
+class ShadowTables:
+    """Context manager rebuilding every table without interrupting the
+    readers of the live tables.
+
+    In the block, the managers and their models use empty shadow copies of
+    their tables. At the end of the block, the managers copy the rows they
+    must preserve from the live tables, then the shadow tables replace the
+    live ones with a single atomic RENAME TABLE. The tables are locked from
+    the copy to the RENAME, so the application waits for the swap instead
+    of writing rows, such as favorites, into the tables about to be
+    dropped. If the block fails or is abandoned, the shadow tables are
+    dropped and the live tables are left untouched.
+    """
+
+    def __init__(self, suffix="_shadow"):
+        """Initializes the shadow tables of the registered managers.
+
+        Args:
+            suffix (str): suffix of the names of the shadow tables.
+            Default value is "_shadow".
+
+        """
+        import purbeurre.models
+
+        self.suffix = suffix
+        self.live_tables = {manager: manager.table for manager in _managers}
+        self.abandoned = False
+
+    def __enter__(self):
+        _set_tables({
+            manager: table + self.suffix
+            for manager, table in self.live_tables.items()
+        })
+        try:
+            # Leftovers of an interrupted rebuild
+            drop_tables()
+            create_tables()
+        except BaseException:
+            _set_tables(self.live_tables)
+            raise
+        return self
+
+    def abandon(self):
+        """Drops the shadow tables at the end of the block instead of
+        swapping them with the live ones.
+        """
+        self.abandoned = True
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None and not self.abandoned:
+                self._swap()
+            else:
+                drop_tables()
+        finally:
+            _set_tables(self.live_tables)
+
+    def _swap(self):
+        """Replaces the live tables by the shadow ones, then drops the
+        previous live tables.
+        """
+        with connection() as db:
+            cursor = db.cursor()
+            cursor.execute("SHOW TABLES")
+            existing_tables = {table for (table,) in cursor}
+            renames = []
+            locks = []
+            for manager, table in self.live_tables.items():
+                if table in existing_tables:
+                    renames.append(f"{table} TO {table}_old")
+                    locks.append(f"{table} WRITE")
+                renames.append(f"{manager.table} TO {table}")
+                locks.append(f"{manager.table} WRITE")
+            # The writes of the application wait until the swap is done,
+            # the commits of preserve_rows() keeping the locks
+            cursor.execute(f"LOCK TABLES {', '.join(locks)}")
+            try:
+                if set(self.live_tables.values()) <= existing_tables:
+                    live_tables = {
+                        manager.table: table
+                        for manager, table in self.live_tables.items()
+                    }
+                    for manager in _managers:
+                        manager.preserve_rows(live_tables)
+                # The readers see either every live table or every new table
+                cursor.execute(f"RENAME TABLE {', '.join(renames)}")
+            finally:
+                cursor.execute("UNLOCK TABLES")
+            for manager, table in reversed(list(self.live_tables.items())):
+                if table in existing_tables:
+                    cursor.execute(f"DROP TABLE {table}_old")
+            db.commit()
+            cursor.close()
@@ -0,0 +1,135 @@
+"""This module reads the products of the exports of the openfoodfacts
+database, so that it can be installed without the API.
+"""
+
+import csv
+import gzip
+import json
+import sys
+
+from purbeurre.validators import PRODUCT_FIELDS
+
+
+def _open_text(path):
+    """Opens a text file, decompressing it on the fly if it ends with .gz."""
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", newline="")
+    return open(path, encoding="utf-8", newline="")
+
+
+def _to_tag(name):
+    """Transforms a name into an openfoodfacts tag without language prefix,
+    "Royaume-Uni" giving "royaume-uni" and "en:france" giving "france".
+    """
+    name = name.strip().lower()
+    if name[2:3] == ":":
+        name = name[3:]
+    return name.replace(" ", "-")
+
+
+def _to_tags(value):
+    """Splits a list of names or tags, stored as a list or as a comma
+    separated string, into tags.
+    """
+    if not value:
+        return set()
+    if isinstance(value, str):
+        value = value.split(",")
+    return {_to_tag(name) for name in value if name.strip()}
+
+
+def _matches(product, field, tags):
+    """Returns True if one of the tags is found in the field of the product
+    or in its tags.
+    """
+    return bool(tags & (
+        _to_tags(product.get(field)) | _to_tags(product.get(f"{field}_tags"))
+    ))
+
+
+def _iter_jsonl(file, countries):
+    """Reads the products of an export in JSON lines format."""
+    # The words of a country tag appear in the line of a product sold in
+    # this country, whatever the case and the separators of the name it is
+    # matched with, which avoids decoding most of the other lines. The lines
+    # holding escaped characters are always decoded, since the words may
+    # be escaped in them.
+    word_lists = [country.split("-") for country in countries or ()]
+    for line in file:
+        if not line.strip():
+            continue
+        if word_lists and "\\u" not in line:
+            lowered_line = line.lower()
+            if not any(
+                all(word in lowered_line for word in words)
+                for words in word_lists
+            ):
+                continue
+        yield json.loads(line)
+
+
+def _iter_csv(file):
+    """Reads the products of an export in CSV format, whose columns are
+    separated by tabulations in the exports of openfoodfacts.
+    """
+    # Some columns of the exports exceed the default limit of 128kB
+    csv.field_size_limit(min(sys.maxsize, 2 ** 31 - 1))
+    header = file.readline()
+    delimiter = "\t" if "\t" in header else ","
+    columns = next(csv.reader([header], delimiter=delimiter))
+    yield from csv.DictReader(file, fieldnames=columns, delimiter=delimiter)
+
+
+def iter_dump_products(
+    path, countries=None, categories=None, fields=PRODUCT_FIELDS
+):
+    """Reads the products of an export of the openfoodfacts database one at
+    a time, so that the memory used does not depend on the size of the
+    export.
+
+    Args:
+        path (str): path of the export, in JSON lines (.jsonl) or CSV (.csv)
+        format, optionally compressed with gzip (.gz).
+        countries (iterable): names or tags of countries, only the products
+        sold in one of them are kept. None keeps every product.
+        categories (iterable): names or tags of categories, only the
+        products of one of them are kept. None keeps every product.
+        fields (iterable): fields kept for each product, None keeps them
+        all. Default value is the fields required by the validators.
+
+    Return:
+        A generator of dictionaries describing the products, in the same
+        format as those downloaded with OpenfoodfactsClient.
+
+    Raises:
+        ValueError if the format of the export is not supported.
+
+    """
+    name = path[:-len(".gz")] if path.endswith(".gz") else path
+    if name.endswith((".jsonl", ".ndjson", ".json")):
+        reader = "jsonl"
+    elif name.endswith((".csv", ".tsv")):
+        reader = "csv"
+    else:
+        raise ValueError("the export must be a .jsonl or a .csv file")
+    countries = {_to_tag(country) for country in countries or ()}
+    categories = {_to_tag(category) for category in categories or ()}
+
+    with _open_text(path) as file:
+        if reader == "jsonl":
+            products = _iter_jsonl(file, countries)
+        else:
+            products = _iter_csv(file)
+        for product in products:
+            if countries and not _matches(product, "countries", countries):
+                continue
+            if categories and not _matches(
+                product, "categories", categories
+            ):
+                continue
+            if fields is not None:
+                product = {
+                    field: product[field]
+                    for field in fields if field in product
+                }
+            yield product
@@ -1,14 +1,97 @@
-from purbeurre.database import db, register_manager
+import re
+import weakref
+from itertools import islice
+
+from purbeurre.cache import LRUCache
+from purbeurre.database import (
+    connection,
+    prepared_cursor,
+    register_manager,
+    transaction,
+)
 from purbeurre import models
+import settings
+
+# Terms accepted by order_by: a column, optionally followed by ASC or DESC,
+# or RAND()
+ORDER_BY_TERM = re.compile(
+    r"(\w+\.)?\w+(\s+(ASC|DESC))?|RAND\(\)", re.IGNORECASE
+)
+
+
+class Constraint:
+    """Primary key or foreign key of a table, which can be created after
+    the table is filled.
+    """
+
+    def __init__(self, columns, references=None):
+        """Initializes a constraint.
+
+        Args:
+            columns (tuple): columns of the key.
+            references (str): table whose id the column references, None
+            for a primary key.
+
+        """
+        self.columns = columns
+        self.references = references
+
+    def definition(self):
+        """Returns the SQL definition of the constraint."""
+        columns = ", ".join(self.columns)
+        if self.references is None:
+            return f"PRIMARY KEY ({columns})"
+        return f"FOREIGN KEY ({columns}) REFERENCES {self.references}(id)"
+
+    def violations_query(self, table):
+        """Returns the query counting the rows of table which prevent the
+        constraint from being created.
+        """
+        columns = ", ".join(self.columns)
+        if self.references is None:
+            return (
+                f"SELECT COUNT(*) FROM ("
+                f"SELECT {columns} FROM {table} "
+                f"GROUP BY {columns} HAVING COUNT(*) > 1"
+                f") AS duplicates"
+            )
+        column = self.columns[0]
+        return (
+            f"SELECT COUNT(*) FROM {table} "
+            f"LEFT JOIN {self.references} AS referenced "
+            f"    ON referenced.id = {table}.{column} "
+            f"WHERE referenced.id IS NULL"
+        )
+
+    def __str__(self):
+        columns = ", ".join(self.columns)
+        if self.references is None:
+            return f"duplicate ({columns})"
+        return f"{columns} missing from {self.references}"
 
 
 class BaseManager:
     """Manager at the base of the construction of all managers."""
 
-    def __init__(self, model):
-        """Initializes a new instance of BaseManager."""
+    def __init__(self, model, identity_map_size=None):
+        """Initializes a new instance of BaseManager.
+
+        Args:
+            model (class): model managed.
+            identity_map_size (int): maximum number of instances kept by
+            get_by_id(). Default value is settings.IDENTITY_MAP_SIZE.
+
+        """
         self.model = model
         self.table = model.table
+        if identity_map_size is None:
+            identity_map_size = settings.IDENTITY_MAP_SIZE
+        # Instances already retrieved by id, returned again without a query
+        self.identity_map = LRUCache(identity_map_size)
+        # Relations loaded by prefetch(), by instance then name of relation
+        self.prefetched = weakref.WeakKeyDictionary()
+        # SQL of the queries already built, by method and shape of options
+        self._queries = {}
         register_manager(self)
 
     def create(self, **kwargs):
@@ -19,139 +102,570 @@ class BaseManager:
         self.save(instance)
         return instance
 
+    def save(self, instance):
+        """Save an instance of the model in the database."""
+        with transaction() as db:
+            cursor = db.cursor()
+            cursor.execute(self.insert_query, vars(instance))
+            cursor.close()
+        self.forget(getattr(instance, "id", None))
+
+    def bulk_create(self, instances, batch_size=1000):
+        """Save many instances of the model in the database.
+
+        The instances are inserted batch by batch, with a multi-row INSERT
+        per batch and a single commit at the end.
+
+        Args:
+            instances (iterable): instances of the model to save.
+            batch_size (int): number of instances inserted per batch.
+            Default value is 1000.
+
+        Return:
+            The list of the saved instances.
+
+        """
+        return self._write_batches(instances, batch_size, self._bulk_insert)
+
+    def _write_batches(self, instances, batch_size, write):
+        """Calls write(cursor, batch) on each batch of instances, in a
+        single transaction committed once every batch is written.
+
+        Return:
+            The list of the instances.
+
+        """
+        instances = iter(instances)
+        written_instances = []
+        with transaction() as db:
+            cursor = db.cursor()
+            try:
+                while True:
+                    batch = list(islice(instances, batch_size))
+                    if not batch:
+                        break
+                    write(cursor, batch)
+                    written_instances.extend(batch)
+            finally:
+                cursor.close()
+        return written_instances
+
+    def _bulk_insert(self, cursor, instances):
+        """Inserts a batch of instances with the cursor.
+
+        executemany() sends a single multi-row INSERT for the whole batch.
+        """
+        cursor.executemany(
+            self.insert_query, [vars(instance) for instance in instances]
+        )
+
+    @property
+    def constraints(self):
+        """Keys and foreign keys of the table which can be created after
+        the table is filled.
+        """
+        return []
+
+    def _format_constraints(self, constraints):
+        """Formats the constraints of the table for CREATE TABLE, if
+        constraints is True.
+        """
+        if not constraints:
+            return ""
+        return "".join(
+            f",\n                {constraint.definition()}"
+            for constraint in self.constraints
+        )
+
+    def find_violations(self):
+        """Counts the rows which prevent the constraints from being created.
+
+        Return:
+            A dictionary giving the number of faulty rows by constraint,
+            empty if the constraints can be created.
+
+        """
+        violations = {}
+        with connection() as db:
+            cursor = db.cursor()
+            for constraint in self.constraints:
+                cursor.execute(constraint.violations_query(self.table))
+                count = cursor.fetchone()[0]
+                if count:
+                    violations[str(constraint)] = count
+            cursor.close()
+        return violations
+
+    def create_constraints(self):
+        """Creates the constraints of a table created without them, with a
+        single ALTER TABLE building every index in one pass.
+
+        The foreign keys are not checked again by MySQL, find_violations()
+        must have been called before.
+        """
+        if not self.constraints:
+            return
+        with connection() as db:
+            cursor = db.cursor()
+            cursor.execute("SET foreign_key_checks = 0")
+            try:
+                cursor.execute(
+                    f"ALTER TABLE {self.table} " + ", ".join(
+                        f"ADD {constraint.definition()}"
+                        for constraint in self.constraints
+                    )
+                )
+            finally:
+                cursor.execute("SET foreign_key_checks = 1")
+                cursor.close()
+
+    @staticmethod
+    def _identity_key(id):
+        """Key of an id in the identity map, the ids written as digits
+        being the same as the integer ones.
+        """
+        if isinstance(id, str) and id.isdigit():
+            return int(id)
+        return id
+
+    def forget(self, *ids):
+        """Removes instances from the identity map, once their row has been
+        written.
+        """
+        for id in ids:
+            self.identity_map.pop(self._identity_key(id))
+
+    def clear_cache(self):
+        """Forgets the rows kept in memory by the manager."""
+        self.identity_map.clear()
+        self.prefetched.clear()
+
+    def preserve_rows(self, live_tables):
+        """Copies the rows which must survive a rebuild from the live table
+        to the table of the manager, which replaces it afterwards.
+
+        Args:
+            live_tables (dict): name of the live table of each rebuilt
+            table.
+
+        """
+
     def delete_all(self):
-        """Clears all items from the table."""
-        cursor = db.cursor()
-        cursor.execute(f"DELETE FROM {self.table}")
-        db.commit()
-        cursor.close()
+        """Clears all items from the table and the identity map."""
+        with transaction() as db:
+            cursor = db.cursor()
+            cursor.execute(f"DELETE FROM {self.table}")
+            cursor.close()
+        self.identity_map.clear()
 
     def drop_table(self):
         """Delete your table itself."""
-        cursor = db.cursor()
-        cursor.execute(f"DROP TABLE IF EXISTS {self.table}")
-        db.commit()
-        cursor.close()
+        with connection() as db:
+            cursor = db.cursor()
+            cursor.execute(f"DROP TABLE IF EXISTS {self.table}")
+            db.commit()
+            cursor.close()
 
     def _format_order_by(self, order_by):
+        """Formats the ORDER BY clause of a query.
+
+        Raises:
+            ValueError if a term of order_by is neither a column, optionally
+            followed by ASC or DESC, nor RAND().
+
+        """
         if not isinstance(order_by, list) or not order_by:
             return ""
-        else:
-            return f" ORDER BY {', '.join(order_by)}"
+        for term in order_by:
+            if not isinstance(term, str) or not ORDER_BY_TERM.fullmatch(term):
+                raise ValueError(f"Invalid order_by term: {term!r}")
+        return f" ORDER BY {', '.join(order_by)}"
 
     def _format_limit(self, limit):
+        """Formats the LIMIT clause of a query, whose numbers are passed as
+        parameters.
+        """
         if not isinstance(limit, list) or not limit:
             return ""
-        else:
-            limit = [str(number) for number in limit]
-            return f" LIMIT {', '.join(limit)}"
+        return f" LIMIT {', '.join('%s' for number in limit)}"
 
-    def get_all(self, order_by=None, limit=None):
-        """Retrieves all the instances of the model in the database."""
-        cursor = db.cursor()
-        cursor.execute(
-            f"SELECT * FROM {self.table}"
-            f"{self._format_order_by(order_by)}"
-            f"{self._format_limit(limit)}"
+    def _query(self, method, build, order_by=None, limit=None):
+        """Returns the SQL of a query followed by its ORDER BY and LIMIT
+        clauses.
+
+        The SQL is built by build() the first time the method is called on
+        the table with the same order_by and the same number of limit
+        values, then reused, so that the prepared statement of the query is
+        reused too.
+
+        Raises:
+            ValueError if order_by is invalid.
+
+        """
+        key = (
+            method,
+            self.table,
+            tuple(order_by) if isinstance(order_by, list) else (),
+            len(limit) if isinstance(limit, list) else 0,
         )
-        results = [self.model(*row) for row in cursor]
-        cursor.close()
-        return results
+        query = self._queries.get(key)
+        if query is None:
+            query = self._queries[key] = (
+                build()
+                + self._format_order_by(order_by)
+                + self._format_limit(limit)
+            )
+        return query
+
+    def _select(self, query, params=(), limit=None):
+        """Runs a query built by _query() as a server-side prepared
+        statement.
+
+        Args:
+            query (str): query whose parameters are positional.
+            params (tuple): parameters of the query.
+            limit (list): numbers of the LIMIT clause of the query.
+
+        Return:
+            The list of the rows.
+
+        """
+        if isinstance(limit, list):
+            params = (*params, *(int(number) for number in limit))
+        with connection() as db:
+            cursor = prepared_cursor(db, query)
+            cursor.execute(query, params)
+            return cursor.fetchall()
+
+    @property
+    def prefetchers(self):
+        """Functions loading a relation of a list of instances with a
+        single query, by name of the relation. Each one returns the related
+        objects of every instance, in the order of the instances.
+        """
+        return {}
+
+    def prefetch(self, instances, relations):
+        """Loads relations of instances with one query per relation, so that
+        the getters of the models do not query them instance by instance.
+
+        Args:
+            instances (list): instances of the model.
+            relations (list): names of the relations, among the keys of
+            prefetchers.
+
+        Return:
+            The instances.
+
+        Raises:
+            ValueError if a relation cannot be prefetched.
+
+        """
+        for relation in relations or ():
+            try:
+                load = self.prefetchers[relation]
+            except KeyError:
+                raise ValueError(
+                    f"{relation!r} cannot be prefetched from {self.table}"
+                ) from None
+            for instance, related in zip(instances, load(instances)):
+                self.prefetched.setdefault(instance, {})[relation] = related
+        return instances
+
+    def get_prefetched(self, instance, relation):
+        """Returns the related objects of instance loaded by prefetch(), None
+        if they were not prefetched.
+        """
+        return self.prefetched.get(instance, {}).get(relation)
+
+    def get_all(self, order_by=None, limit=None, prefetch=None):
+        """Retrieves all the instances of the model in the database.
+
+        Args:
+            order_by (list): terms of the ORDER BY clause.
+            limit (list): numbers of the LIMIT clause.
+            prefetch (list): relations loaded for all the instances, see
+            prefetch().
+
+        """
+        query = self._query(
+            "get_all", lambda: f"SELECT * FROM {self.table}", order_by, limit
+        )
+        instances = [
+            self.model(*row) for row in self._select(query, limit=limit)
+        ]
+        return self.prefetch(instances, prefetch)
 
     def get_by_id(self, id):
-        """Retrieves in base an instance of the model compared to its id."""
-        cursor = db.cursor()
-        cursor.execute(
-            f"SELECT * FROM {self.table} WHERE id = %(id)s", {"id": id}
+        """Retrieves in base an instance of the model compared to its id.
+
+        The instances already retrieved are returned from the identity map,
+        without a query.
+        """
+        key = self._identity_key(id)
+        instance = self.identity_map.get(key)
+        if instance is not None:
+            return instance
+        query = self._query(
+            "get_by_id", lambda: f"SELECT * FROM {self.table} WHERE id = %s"
         )
-        results = [self.model(*row) for row in cursor]
+        results = [self.model(*row) for row in self._select(query, (id,))]
         if len(results) == 0:
             raise ValueError(f"No instance corresponds to id = {id}")
-        cursor.close()
+        self.identity_map.put(key, results[0])
         return results[0]
 
+    def get_by_ids(self, ids):
+        """Retrieves the instances of several ids with a single query, the
+        instances of the identity map being returned without a query.
+
+        Args:
+            ids (iterable): ids of the instances.
+
+        Return:
+            A dictionary giving the instance of each id found, by id.
+
+        """
+        instances = {}
+        missing_ids = []
+        for id in {self._identity_key(id) for id in ids}:
+            instance = self.identity_map.get(id)
+            if instance is None:
+                missing_ids.append(id)
+            else:
+                instances[id] = instance
+        if not missing_ids:
+            return instances
+        with connection() as db:
+            cursor = db.cursor()
+            cursor.execute(
+                f"SELECT * FROM {self.table} "
+                f"WHERE id IN ({', '.join('%s' for id in missing_ids)})",
+                tuple(missing_ids),
+            )
+            for row in cursor:
+                instance = self.model(*row)
+                instances[instance.id] = instance
+                self.identity_map.put(instance.id, instance)
+            cursor.close()
+        return instances
+
 
 class ProductManager(BaseManager):
     """Manager responsible for managing the Product model."""
 
-    def create_table(self):
+    @property
+    def prefetchers(self):
+        """The categories and the stores of the products."""
+        return {
+            "categories": models.Category.manager.get_categories_by_products,
+            "stores": models.Store.manager.get_stores_by_products,
+        }
+
+    def create_table(self, constraints=True):
         """Creates the table associated with the Product model."""
-        cursor = db.cursor()
-        cursor.execute(
-            f"""CREATE TABLE IF NOT EXISTS {self.table} (
-                id BIGINT PRIMARY KEY,
-                name VARCHAR(200) NOT NULL,
-                url VARCHAR(255) NOT NULL,
-                nutriscore VARCHAR(1) NOT NULL,
-                description TEXT
-            )"""
-        )
-        cursor.close()
+        with connection() as db:
+            cursor = db.cursor()
+            cursor.execute(
+                f"""CREATE TABLE IF NOT EXISTS {self.table} (
+                    id BIGINT PRIMARY KEY,
+                    name VARCHAR(200) NOT NULL,
+                    url VARCHAR(255) NOT NULL,
+                    nutriscore VARCHAR(1) NOT NULL,
+                    description TEXT
+                )"""
+            )
+            cursor.close()
 
-    def save(self, instance):
-        """Save an instance of Product in the database."""
-        cursor = db.cursor()
-        cursor.execute(
+    @property
+    def insert_query(self):
+        """Query inserting a Product in the database."""
+        return (
             f"""INSERT INTO {self.table} (
                 id, name, url, nutriscore, description
             )
             VALUES (%(id)s, %(name)s, %(url)s, %(nutriscore)s, %(description)s)
-            """,
-            vars(instance),
+            """
         )
-        db.commit()
-        cursor.close()
 
-    def get_products_by_category(self, category, order_by=None, limit=None):
-        """Retrieves all the products associated with a category in the database."""
-        cursor = db.cursor()
-        cursor.execute(
-            f"SELECT id, name, url, nutriscore, description "
-            f"FROM {self.table} "
-            f"JOIN {models.ProductCategory.table} "
-            f"    ON {self.table}_id = id "
-            f"WHERE {models.Category.table}_id = %(id)s"
-            f"{self._format_order_by(order_by)}"
-            f"{self._format_limit(limit)}",
-            vars(category),
+    @property
+    def upsert_query(self):
+        """Query inserting a Product, or updating it if it already exists."""
+        return (
+            f"""{self.insert_query}
+            ON DUPLICATE KEY UPDATE
+                name = VALUES(name),
+                url = VALUES(url),
+                nutriscore = VALUES(nutriscore),
+                description = VALUES(description)
+            """
+        )
+
+    def bulk_upsert(self, instances, batch_size=1000):
+        """Saves many products, updating those which already exist.
+
+        The products of each batch are compared with the stored ones, so
+        only the new and the modified products are written.
+
+        Args:
+            instances (iterable): products to save.
+            batch_size (int): number of products compared and written per
+            batch. Default value is 1000.
+
+        Return:
+            The list of the products which were new or modified.
+
+        """
+        changed_instances = []
+
+        def upsert(cursor, batch):
+            cursor.execute(
+                "SELECT id, name, url, nutriscore, description "
+                f"FROM {self.table} "
+                f"WHERE id IN ({', '.join('%s' for instance in batch)})",
+                tuple(instance.id for instance in batch),
+            )
+            stored_rows = {row[0]: row[1:] for row in cursor}
+            changed_batch = [
+                instance for instance in batch
+                if stored_rows.get(int(instance.id)) != (
+                    instance.name,
+                    instance.url,
+                    instance.nutriscore,
+                    instance.description,
+                )
+            ]
+            if changed_batch:
+                cursor.executemany(
+                    self.upsert_query,
+                    [vars(instance) for instance in changed_batch],
+                )
+            changed_instances.extend(changed_batch)
+
+        self._write_batches(instances, batch_size, upsert)
+        self.forget(*(instance.id for instance in changed_instances))
+        return changed_instances
+
+    def filter_existing_ids(self, ids):
+        """Returns the set of the ids of ids which are in the table."""
+        ids = [id for id in ids if str(id).isdigit()]
+        if not ids:
+            return set()
+        with connection() as db:
+            cursor = db.cursor()
+            cursor.execute(
+                f"SELECT id FROM {self.table} "
+                f"WHERE id IN ({', '.join('%s' for id in ids)})",
+                tuple(ids),
+            )
+            stored_ids = {id for (id,) in cursor}
+            cursor.close()
+        return {id for id in ids if int(id) in stored_ids}
+
+    def prune(self, keep, batch_size=1000):
+        """Deletes the products whose id is not in keep, with their
+        categories and stores. The products saved in favorites are kept.
+
+        Args:
+            keep (iterable): ids of the products to keep.
+            batch_size (int): number of products deleted per batch.
+            Default value is 1000.
+
+        Return:
+            The number of deleted products.
+
+        """
+        keep = {int(id) for id in keep}
+        with connection() as db:
+            cursor = db.cursor()
+            cursor.execute(
+                f"SELECT id FROM {self.table} "
+                "WHERE id NOT IN (SELECT product_id "
+                f"                 FROM {models.Favorite.table}) "
+                "AND id NOT IN (SELECT substitute_id "
+                f"               FROM {models.Favorite.table})"
+            )
+            ids = [id for (id,) in cursor if id not in keep]
+            cursor.close()
+
+        def delete(cursor, batch):
+            placeholders = ", ".join("%s" for id in batch)
+            for table, column in (
+                (models.ProductCategory.table, "product_id"),
+                (models.ProductStore.table, "product_id"),
+                (self.table, "id"),
+            ):
+                cursor.execute(
+                    f"DELETE FROM {table} "
+                    f"WHERE {column} IN ({placeholders})",
+                    tuple(batch),
+                )
+
+        self._write_batches(ids, batch_size, delete)
+        self.forget(*ids)
+        return len(ids)
+
+    def get_products_by_category(
+        self, category, order_by=None, limit=None, prefetch=None
+    ):
+        """Retrieves all the products associated with a category in the
+        database, prefetching the relations of prefetch.
+        """
+        query = self._query(
+            "get_products_by_category",
+            lambda: (
+                "SELECT id, name, url, nutriscore, description "
+                f"FROM {self.table} "
+                f"JOIN {models.ProductCategory.table} "
+                "    ON product_id = id "
+                "WHERE category_id = %s"
+            ),
+            order_by,
+            limit,
         )
-        results = [self.model(*row) for row in cursor]
-        cursor.close()
-        return results
+        products = [
+            self.model(*row)
+            for row in self._select(query, (category.id,), limit)
+        ]
+        return self.prefetch(products, prefetch)
 
     def get_products_by_store(self, store, order_by=None, limit=None):
         """Retrieves all the products associated with a store in the database."""
-        cursor = db.cursor()
-        cursor.execute(
-            f"SELECT id, name, url, nutriscore, description "
-            f"FROM {self.table} "
-            f"JOIN {models.ProductStore.table} "
-            f"     ON {self.table}_id = id "
-            f"WHERE {models.Store.table}_id = %(id)s"
-            f"{self._format_order_by(order_by)}"
-            f"{self._format_limit(limit)}",
-            vars(store),
+        query = self._query(
+            "get_products_by_store",
+            lambda: (
+                "SELECT id, name, url, nutriscore, description "
+                f"FROM {self.table} "
+                f"JOIN {models.ProductStore.table} "
+                "    ON product_id = id "
+                "WHERE store_id = %s"
+            ),
+            order_by,
+            limit,
         )
-        results = [self.model(*row) for row in cursor]
-        cursor.close()
-        return results
+        return [
+            self.model(*row)
+            for row in self._select(query, (store.id,), limit)
+        ]
 
     def get_substitutes_by_product(self, product, order_by=None, limit=None):
         """Retrieves all the substitutes associated with a product in the database."""
-        cursor = db.cursor()
-        cursor.execute(
-            f"SELECT id, name, url, nutriscore, description "
-            f"FROM {self.table} "
-            f"JOIN {models.Favorite.table} "
-            f"    ON substitute_id = id "
-            f"WHERE {models.Product.table}_id = %(id)s"
-            f"{self._format_order_by(order_by)}"
-            f"{self._format_limit(limit)}",
-            vars(product),
+        query = self._query(
+            "get_substitutes_by_product",
+            lambda: (
+                "SELECT id, name, url, nutriscore, description "
+                f"FROM {self.table} "
+                f"JOIN {models.Favorite.table} "
+                "    ON substitute_id = id "
+                "WHERE product_id = %s"
+            ),
+            order_by,
+            limit,
         )
-        results = [self.model(*row) for row in cursor]
-        cursor.close()
-        return results
+        return [
+            self.model(*row)
+            for row in self._select(query, (product.id,), limit)
+        ]
 
     def get_products_by_substitute(
         self, substitute, order_by=None, limit=None
@@ -159,162 +673,435 @@ class ProductManager(BaseManager):
         """Retrieves in base all the products associated with a product as
         that substitute.
         """
-        cursor = db.cursor()
-        cursor.execute(
-            f"SELECT id, name, url, nutriscore, description "
-            f"FROM {self.table} "
-            f"JOIN {models.Favorite.table} "
-            f"    ON {self.table}_id = id "
-            f"WHERE substitute_id = %(id)s"
-            f"{self._format_order_by(order_by)}"
-            f"{self._format_limit(limit)}",
-            vars(substitute),
+        query = self._query(
+            "get_products_by_substitute",
+            lambda: (
+                "SELECT id, name, url, nutriscore, description "
+                f"FROM {self.table} "
+                f"JOIN {models.Favorite.table} "
+                "    ON product_id = id "
+                "WHERE substitute_id = %s"
+            ),
+            order_by,
+            limit,
         )
-        results = [self.model(*row) for row in cursor]
-        cursor.close()
-        return results
+        return [
+            self.model(*row)
+            for row in self._select(query, (substitute.id,), limit)
+        ]
 
     def find_substitutes_for_product(
-        self, product, order_by=["common_categories_number DESC"], limit=None
+        self,
+        product,
+        order_by=["common_categories_number DESC"],
+        limit=None,
+        prefetch=None,
     ):
-        """Look for healthier substitutes for a product."""
-        cursor = db.cursor()
-        cursor.execute(
-            f"""SELECT
-                id,
-                name,
-                url,
-                nutriscore,
-                description,
-                COUNT(id) as common_categories_number
-            FROM {models.Product.table}
-            JOIN {models.ProductCategory.table}
-                ON {models.Product.table}_id = id
-            WHERE id != %(id)s
-                AND nutriscore < %(nutriscore)s
-                AND {models.Category.table}_id IN (
-                    SELECT {models.Category.table}_id
-                    FROM {models.ProductCategory.table}
-                    WHERE {models.Product.table}_id = %(id)s
-                )
-            GROUP BY id
-            {self._format_order_by(order_by)}
-            {self._format_limit(limit)}
-            """,
-            vars(product),
+        """Look for healthier substitutes for a product, prefetching the
+        relations of prefetch.
+        """
+        query = self._query(
+            "find_substitutes_for_product",
+            lambda: f"""SELECT
+                    id,
+                    name,
+                    url,
+                    nutriscore,
+                    description,
+                    COUNT(id) as common_categories_number
+                FROM {models.Product.table}
+                JOIN {models.ProductCategory.table}
+                    ON product_id = id
+                WHERE id != %s
+                    AND nutriscore < %s
+                    AND category_id IN (
+                        SELECT category_id
+                        FROM {models.ProductCategory.table}
+                        WHERE product_id = %s
+                    )
+                GROUP BY id""",
+            order_by,
+            limit,
         )
-        results = [self.model(*row[:-1]) for row in cursor]
-        cursor.close()
-        return results
+        rows = self._select(
+            query, (product.id, product.nutriscore, product.id), limit
+        )
+        substitutes = [self.model(*row[:-1]) for row in rows]
+        return self.prefetch(substitutes, prefetch)
 
 
-class CategoryManager(BaseManager):
-    """Manager responsible for managing the Category model."""
+class NamedManager(BaseManager):
+    """Base of the managers of models identified by a unique name and an
+    auto-generated id.
 
-    def create_table(self):
-        """Creates the table associated with the Category model."""
-        cursor = db.cursor()
-        cursor.execute(
-            f"""CREATE TABLE IF NOT EXISTS {self.table} (
-                id INT PRIMARY KEY AUTO_INCREMENT,
-                name VARCHAR(100) NOT NULL UNIQUE
+    The ids of the names already saved or loaded are kept in a bounded
+    cache, so that a name seen again is resolved without a query.
+    """
+
+    def __init__(self, model, cache_size=None):
+        """Initializes a new instance of NamedManager.
+
+        Args:
+            model (class): model managed.
+            cache_size (int): maximum number of names whose id is cached.
+            Default value is settings.NAME_CACHE_SIZE.
+
+        """
+        super().__init__(model)
+        if cache_size is None:
+            cache_size = settings.NAME_CACHE_SIZE
+        self.ids = LRUCache(cache_size)
+
+    def preload(self):
+        """Loads the ids of the names of the table into the cache, up to
+        the size of the cache.
+        """
+        with connection() as db:
+            cursor = db.cursor()
+            cursor.execute(
+                f"SELECT id, name FROM {self.table} LIMIT %s",
+                (self.ids.max_size,),
             )
+            for id, name in cursor:
+                self.ids.put(name, id)
+            cursor.close()
+
+    def resolve_ids(self, names, batch_size=1000):
+        """Returns the ids of names, saving the names not yet in the table.
+
+        Args:
+            names (iterable): names to resolve.
+            batch_size (int): number of new names inserted per batch.
+            Default value is 1000.
+
+        Return:
+            A dictionary associating each name with its id.
+
+        """
+        instances = {name: self.model(name=name) for name in names}
+        self.bulk_create(instances.values(), batch_size=batch_size)
+        return {name: instance.id for name, instance in instances.items()}
+
+    @property
+    def insert_query(self):
+        """Query inserting an instance, or retrieving the id of the
+        instance of the same name if it already exists.
+        """
+        return (
+            f"""INSERT INTO {self.table} (id, name)
+            VALUES (%(id)s, %(name)s)
+            ON DUPLICATE KEY UPDATE id = LAST_INSERT_ID(id)
             """
         )
-        cursor.close()
 
     def save(self, instance):
-        """Save an instance of Category in database."""
-        cursor = db.cursor()
+        """Save an instance in the database, setting its id."""
+        if instance.id is None:
+            instance.id = self.ids.get(instance.name)
+            if instance.id is not None:
+                return
+        with transaction() as db:
+            cursor = db.cursor()
+            cursor.execute(self.insert_query, vars(instance))
+            instance.id = cursor.lastrowid
+            cursor.close()
+        self.ids.put(instance.name, instance.id)
+        self.forget(instance.id)
+
+    def bulk_create(self, instances, batch_size=1000):
+        """Save many instances in the database, setting their ids.
+
+        Only the instances whose name is not in the cache are sent to the
+        database.
+        """
+        instances = list(instances)
+        new_instances = []
+        for instance in instances:
+            if instance.id is None:
+                instance.id = self.ids.get(instance.name)
+                if instance.id is None:
+                    new_instances.append(instance)
+        if new_instances:
+            super().bulk_create(new_instances, batch_size=batch_size)
+            # The ids are cached once they have been written, a rolled back
+            # transaction clears the cache
+            for instance in new_instances:
+                self.ids.put(instance.name, instance.id)
+        return instances
+
+    def _bulk_insert(self, cursor, instances):
+        """Inserts a batch of instances with the cursor, setting their ids.
+
+        The new names are inserted with a single multi-row INSERT IGNORE,
+        then the ids of all the names are retrieved with a single SELECT.
+        """
+        names = list({instance.name for instance in instances})
+        cursor.executemany(
+            f"INSERT IGNORE INTO {self.table} (name) VALUES (%(name)s)",
+            [{"name": name} for name in names],
+        )
         cursor.execute(
-            f"""INSERT INTO {self.table} (id, name)
-            VALUES (%(id)s, %(name)s)
-            ON DUPLICATE KEY UPDATE id = LAST_INSERT_ID(id)
-            """,
-            vars(instance),
+            f"SELECT id, name FROM {self.table} "
+            f"WHERE name IN ({', '.join('%s' for name in names)})",
+            tuple(names),
         )
-        instance.id = cursor.lastrowid
-        db.commit()
-        cursor.close()
+        ids = {name: id for id, name in cursor}
+        for instance in instances:
+            instance.id = ids.get(instance.name)
+            if instance.id is None:
+                # The collation considers the name equal to a stored name
+                # written differently, such as "pates" and "pâtes"
+                cursor.execute(self.insert_query, vars(instance))
+                instance.id = cursor.lastrowid
+
+    def _get_by_products(self, products, association, column):
+        """Retrieves the instances associated with products with a single
+        query.
+
+        Args:
+            products (list): products whose instances are retrieved.
+            association (class): model associating the products with the
+            instances.
+            column (str): column of association holding the instance ids.
+
+        Return:
+            The list of the instances of each product, in the order of the
+            products.
+
+        """
+        related = {
+            self._identity_key(product.id): [] for product in products
+        }
+        if not related:
+            return []
+        with connection() as db:
+            cursor = db.cursor()
+            cursor.execute(
+                "SELECT product_id, id, name "
+                f"FROM {self.table} "
+                f"JOIN {association.table} "
+                f"    ON {column} = id "
+                f"WHERE product_id IN ({', '.join('%s' for id in related)})",
+                tuple(related),
+            )
+            for product_id, *row in cursor:
+                related[product_id].append(self.model(*row))
+            cursor.close()
+        return [
+            related[self._identity_key(product.id)] for product in products
+        ]
+
+    def clear_cache(self):
+        """Forgets the ids of the names and the identity map."""
+        super().clear_cache()
+        self.ids.clear()
+
+    def delete_all(self):
+        """Clears all items from the table and the cache of the ids."""
+        super().delete_all()
+        self.clear_cache()
+
+    def drop_table(self):
+        """Delete the table itself and the cache of the ids."""
+        super().drop_table()
+        self.clear_cache()
+
+
+class CategoryManager(NamedManager):
+    """Manager responsible for managing the Category model."""
+
+    def create_table(self, constraints=True):
+        """Creates the table associated with the Category model."""
+        with connection() as db:
+            cursor = db.cursor()
+            cursor.execute(
+                f"""CREATE TABLE IF NOT EXISTS {self.table} (
+                    id INT PRIMARY KEY AUTO_INCREMENT,
+                    name VARCHAR(100) NOT NULL UNIQUE
+                )
+                """
+            )
+            cursor.close()
 
     def get_categories_by_product(self, product, order_by=None, limit=None):
         """Retrieves in base all the categories associated with a product."""
-        cursor = db.cursor()
-        cursor.execute(
-            f"SELECT id, name "
-            f"FROM {self.table} "
-            f"JOIN {models.ProductCategory.table} "
-            f"    ON {self.table}_id = id "
-            f"WHERE {models.Product.table}_id = %(id)s"
-            f"{self._format_order_by(order_by)}"
-            f"{self._format_limit(limit)}",
-            vars(product),
+        query = self._query(
+            "get_categories_by_product",
+            lambda: (
+                "SELECT id, name "
+                f"FROM {self.table} "
+                f"JOIN {models.ProductCategory.table} "
+                "    ON category_id = id "
+                "WHERE product_id = %s"
+            ),
+            order_by,
+            limit,
+        )
+        return [
+            self.model(*row)
+            for row in self._select(query, (product.id,), limit)
+        ]
+
+    def get_categories_by_products(self, products):
+        """Retrieves the categories of several products with a single
+        query, in the order of the products.
+        """
+        return self._get_by_products(
+            products, models.ProductCategory, "category_id"
         )
-        results = [self.model(*row) for row in cursor]
-        cursor.close()
-        return results
 
     def get_by_names(self, *names):
         """Retrieves based on categories by name."""
-        cursor = db.cursor()
-        cursor.execute(
-            f"SELECT * FROM {self.table} "
-            f"WHERE name IN ({', '.join('%s' for name in names)}) ",
-            tuple(names),
+        query = self._query(
+            ("get_by_names", len(names)),
+            lambda: (
+                f"SELECT * FROM {self.table} "
+                f"WHERE name IN ({', '.join('%s' for name in names)})"
+            ),
         )
-        results = [self.model(*row) for row in cursor]
-        cursor.close()
-        return results
+        return [self.model(*row) for row in self._select(query, names)]
 
     def get_with_excluded_names(self, *names, **kwargs):
         """Retrieve categories whose name is not in names."""
         order_by = kwargs.get('order_by')
         limit = kwargs.get('limit')
 
-        cursor = db.cursor()
-        cursor.execute(
-            f"SELECT * FROM {self.table} "
-            f"WHERE name NOT IN ({', '.join('%s' for name in names)}) "
-            f"{self._format_order_by(order_by)}"
-            f"{self._format_limit(limit)}",
-            tuple(names),
+        query = self._query(
+            ("get_with_excluded_names", len(names)),
+            lambda: (
+                f"SELECT * FROM {self.table} "
+                f"WHERE name NOT IN ({', '.join('%s' for name in names)})"
+            ),
+            order_by,
+            limit,
         )
-        results = [self.model(*row) for row in cursor]
-        cursor.close()
-        return results
+        return [
+            self.model(*row) for row in self._select(query, names, limit)
+        ]
+
 
+class AssociationManager(BaseManager):
+    """Base of the managers of the associations between the products and
+    another model.
+    """
 
-class ProductCategoryManager(BaseManager):
+    # Column holding the id of the instance associated with the product,
+    # set by each subclass
+    related_column = None
+
+    def get_related_ids(self, product_ids):
+        """Retrieves the ids associated with products.
+
+        Return:
+            A dictionary associating the id of each product with the set of
+            the ids associated with it.
+
+        """
+        product_ids = [int(product_id) for product_id in product_ids]
+        related_ids = {product_id: set() for product_id in product_ids}
+        if not product_ids:
+            return related_ids
+        with connection() as db:
+            cursor = db.cursor()
+            cursor.execute(
+                f"SELECT product_id, {self.related_column} "
+                f"FROM {self.table} "
+                "WHERE product_id "
+                f"IN ({', '.join('%s' for product_id in product_ids)})",
+                tuple(product_ids),
+            )
+            for product_id, related_id in cursor:
+                related_ids[product_id].add(related_id)
+            cursor.close()
+        return related_ids
+
+    def replace(self, related_ids):
+        """Makes the associations of products match related_ids, only the
+        associations added or removed being written.
+
+        Args:
+            related_ids (dict): set of the associated ids by product id.
+
+        Return:
+            A (added, removed) tuple of the number of associations written.
+
+        """
+        related_ids = {
+            int(product_id): set(ids)
+            for product_id, ids in related_ids.items()
+        }
+        stored_ids = self.get_related_ids(related_ids)
+        added = [
+            (product_id, related_id)
+            for product_id, ids in related_ids.items()
+            for related_id in ids - stored_ids[product_id]
+        ]
+        removed = [
+            (product_id, related_id)
+            for product_id, ids in stored_ids.items()
+            for related_id in ids - related_ids[product_id]
+        ]
+        if not added and not removed:
+            return 0, 0
+        with transaction() as db:
+            cursor = db.cursor()
+            try:
+                if added:
+                    cursor.executemany(
+                        f"INSERT IGNORE INTO {self.table} "
+                        f"(product_id, {self.related_column}) "
+                        "VALUES (%s, %s)",
+                        added,
+                    )
+                if removed:
+                    cursor.execute(
+                        f"DELETE FROM {self.table} "
+                        f"WHERE (product_id, {self.related_column}) "
+                        f"IN ({', '.join('(%s, %s)' for pair in removed)})",
+                        tuple(id for pair in removed for id in pair),
+                    )
+            finally:
+                cursor.close()
+            return len(added), len(removed)
+
+
+class ProductCategoryManager(AssociationManager):
     """Manager responsible for managing the ProductCategory model."""
 
-    def create_table(self):
+    related_column = "category_id"
+
+    @property
+    def constraints(self):
+        """Primary key and foreign keys of the table."""
+        return [
+            Constraint(("product_id", "category_id")),
+            Constraint(("product_id",), models.Product.table),
+            Constraint(("category_id",), models.Category.table),
+        ]
+
+    def create_table(self, constraints=True):
         """Creates the association table associated with the ProductCategory model."""
-        cursor = db.cursor()
-        cursor.execute(
-            f"""CREATE TABLE IF NOT EXISTS {self.table} (
-                {models.Product.table}_id BIGINT,
-                {models.Category.table}_id INT,
-                PRIMARY KEY({models.Product.table}_id, category_id),
-                FOREIGN KEY ({models.Product.table}_id)
-                    REFERENCES {models.Product.table}(id),
-                FOREIGN KEY ({models.Category.table}_id)
-                    REFERENCES {models.Category.table}(id)
+        with connection() as db:
+            cursor = db.cursor()
+            cursor.execute(
+                f"""CREATE TABLE IF NOT EXISTS {self.table} (
+                    product_id BIGINT NOT NULL,
+                    category_id INT NOT NULL{self._format_constraints(
+                        constraints
+                    )}
+                )
+                """
             )
-            """
-        )
-        cursor.close()
+            cursor.close()
 
-    def save(self, instance):
-        """Save an instance of ProductCategory in database."""
-        cursor = db.cursor()
-        cursor.execute(
+    @property
+    def insert_query(self):
+        """Query inserting a ProductCategory, unless it already exists."""
+        return (
             f"""INSERT IGNORE INTO {self.table} (product_id, category_id)
             VALUES (%(product_id)s, %(category_id)s)
-            """,
-            vars(instance),
+            """
         )
-        db.commit()
-        cursor.close()
 
     def get_by_id(self, product_id, category_id):
         raise NotImplementedError(
@@ -332,85 +1119,86 @@ class ProductCategoryManager(BaseManager):
             self.create(product=product, category=category)
 
 
-class StoreManager(BaseManager):
+class StoreManager(NamedManager):
     """Manager responsible for managing the Store model."""
 
-    def create_table(self):
+    def create_table(self, constraints=True):
         """Crée la table associée au modèle Store."""
-        cursor = db.cursor()
-        cursor.execute(
-            f"""CREATE TABLE IF NOT EXISTS {self.table} (
-                id INT PRIMARY KEY AUTO_INCREMENT,
-                name VARCHAR(100) NOT NULL UNIQUE
+        with connection() as db:
+            cursor = db.cursor()
+            cursor.execute(
+                f"""CREATE TABLE IF NOT EXISTS {self.table} (
+                    id INT PRIMARY KEY AUTO_INCREMENT,
+                    name VARCHAR(100) NOT NULL UNIQUE
+                )
+                """
             )
-            """
-        )
-        cursor.close()
-
-    def save(self, instance):
-        """Save a Store instance in the database."""
-        cursor = db.cursor()
-        cursor.execute(
-            f"""INSERT INTO {self.table} (id, name)
-            VALUES (%(id)s, %(name)s)
-            ON DUPLICATE KEY UPDATE id = LAST_INSERT_ID(id)
-            """,
-            vars(instance),
-        )
-        instance.id = cursor.lastrowid
-        db.commit()
-        cursor.close()
+            cursor.close()
 
     def get_stores_by_product(self, product, order_by=None, limit=None):
         """Retrieves all the stores associated with a product in the database."""
-        cursor = db.cursor()
-        cursor.execute(
-            f"SELECT id, name "
-            f"FROM {self.table} "
-            f"JOIN {models.ProductStore.table} "
-            f"    ON {self.table}_id = id "
-            f"WHERE {models.Product.table}_id = %(id)s"
-            f"{self._format_order_by(order_by)}"
-            f"{self._format_limit(limit)}",
-            vars(product),
+        query = self._query(
+            "get_stores_by_product",
+            lambda: (
+                "SELECT id, name "
+                f"FROM {self.table} "
+                f"JOIN {models.ProductStore.table} "
+                "    ON store_id = id "
+                "WHERE product_id = %s"
+            ),
+            order_by,
+            limit,
         )
-        results = [self.model(*row) for row in cursor]
-        cursor.close()
-        return results
+        return [
+            self.model(*row)
+            for row in self._select(query, (product.id,), limit)
+        ]
+
+    def get_stores_by_products(self, products):
+        """Retrieves the stores of several products with a single query, in
+        the order of the products.
+        """
+        return self._get_by_products(products, models.ProductStore, "store_id")
 
 
-class ProductStoreManager(BaseManager):
+class ProductStoreManager(AssociationManager):
     """Manager responsible for managing the ProductStore model."""
 
-    def create_table(self):
+    related_column = "store_id"
+
+    @property
+    def constraints(self):
+        """Primary key and foreign keys of the table."""
+        return [
+            Constraint(("product_id", "store_id")),
+            Constraint(("product_id",), models.Product.table),
+            Constraint(("store_id",), models.Store.table),
+        ]
+
+    def create_table(self, constraints=True):
         """Creates the association table associated with the
         ProductStore model."""
-        cursor = db.cursor()
-        cursor.execute(
-            f"""CREATE TABLE IF NOT EXISTS {self.table} (
-                {models.Product.table}_id BIGINT,
-                {models.Store.table}_id INT,
-                PRIMARY KEY({models.Product.table}_id, store_id),
-                FOREIGN KEY ({models.Product.table}_id)
-                    REFERENCES {models.Product.table}(id),
-                FOREIGN KEY ({models.Store.table}_id)
-                    REFERENCES {models.Store.table}(id)
+        with connection() as db:
+            cursor = db.cursor()
+            cursor.execute(
+                f"""CREATE TABLE IF NOT EXISTS {self.table} (
+                    product_id BIGINT NOT NULL,
+                    store_id INT NOT NULL{self._format_constraints(
+                        constraints
+                    )}
+                )
+                """
             )
-            """
-        )
-        cursor.close()
+            cursor.close()
 
-    def save(self, instance):
-        """Save an instance of ProductStore in database."""
-        cursor = db.cursor()
-        cursor.execute(
+    @property
+    def insert_query(self):
+        """Query inserting a ProductStore, unless it already exists."""
+        return (
             f"""INSERT IGNORE INTO {self.table} (product_id, store_id)
             VALUES (%(product_id)s, %(store_id)s)
-            """,
-            vars(instance),
+            """
         )
-        db.commit()
-        cursor.close()
 
     def get_by_id(self, product_id, category_id):
         raise NotImplementedError(
@@ -431,38 +1219,128 @@ class ProductStoreManager(BaseManager):
 class FavoriteManager(BaseManager):
     """Manager responsible for managing the Favorite model."""
 
-    def create_table(self):
+    @property
+    def prefetchers(self):
+        """The (product, substitute) pairs of the favorites."""
+        return {"products": self.get_products_of_favorites}
+
+    def get_products_of_favorites(self, favorites):
+        """Retrieves the products and the substitutes of favorites with a
+        single query.
+
+        Return:
+            The list of the (product, substitute) pairs of the favorites, in
+            the order of the favorites.
+
+        """
+        products = models.Product.manager.get_by_ids(
+            id
+            for favorite in favorites
+            for id in (favorite.product_id, favorite.substitute_id)
+        )
+        return [
+            (
+                products.get(self._identity_key(favorite.product_id)),
+                products.get(self._identity_key(favorite.substitute_id)),
+            )
+            for favorite in favorites
+        ]
+
+    @property
+    def constraints(self):
+        """Primary key and foreign keys of the table."""
+        return [
+            Constraint(("product_id", "substitute_id")),
+            Constraint(("product_id",), models.Product.table),
+            Constraint(("substitute_id",), models.Product.table),
+        ]
+
+    def create_table(self, constraints=True):
         """Creates the table associated with the Favorite model."""
-        cursor = db.cursor()
-        cursor.execute(
-            f"""CREATE TABLE IF NOT EXISTS {self.table} (
-                {models.Product.table}_id BIGINT,
-                substitute_id BIGINT,
-                PRIMARY KEY({models.Product.table}_id, substitute_id),
-                FOREIGN KEY ({models.Product.table}_id)
-                    REFERENCES {models.Product.table}(id),
-                FOREIGN KEY (substitute_id)
-                    REFERENCES {models.Product.table}(id)
+        with connection() as db:
+            cursor = db.cursor()
+            cursor.execute(
+                f"""CREATE TABLE IF NOT EXISTS {self.table} (
+                    product_id BIGINT NOT NULL,
+                    substitute_id BIGINT NOT NULL{self._format_constraints(
+                        constraints
+                    )}
+                )
+                """
             )
-            """
-        )
-        cursor.close()
+            cursor.close()
 
-    def save(self, instance):
-        """Save an instance of Favorite in the database."""
-        cursor = db.cursor()
-        cursor.execute(
+    @property
+    def insert_query(self):
+        """Query inserting a Favorite, unless it already exists."""
+        return (
             f"""INSERT IGNORE INTO {self.table} (product_id, substitute_id)
             VALUES (%(product_id)s, %(substitute_id)s)
-            """,
-            vars(instance),
+            """
         )
-        db.commit()
-        cursor.close()
 
     def get_by_id(self, product_id, category_id):
         raise NotImplementedError("get_by_id() is not supported on Favorite")
 
+    def preserve_rows(self, live_tables):
+        """Copies the favorites of the live table. The products they
+        reference which are not in the rebuilt catalog are copied too, with
+        their categories and stores.
+        """
+        product = models.Product.table
+        live_favorite = live_tables[self.table]
+        live_product = live_tables[product]
+        with transaction() as db:
+            cursor = db.cursor()
+            cursor.execute(
+                f"SELECT id FROM {live_product} "
+                f"WHERE id IN (SELECT product_id FROM {live_favorite} "
+                f"    UNION SELECT substitute_id FROM {live_favorite}) "
+                f"AND id NOT IN (SELECT id FROM {product})"
+            )
+            missing_ids = tuple(id for (id,) in cursor)
+            if missing_ids:
+                placeholders = ", ".join("%s" for id in missing_ids)
+                cursor.execute(
+                    f"INSERT INTO {product} "
+                    f"SELECT id, name, url, nutriscore, description "
+                    f"FROM {live_product} WHERE id IN ({placeholders})",
+                    missing_ids,
+                )
+                for association, named, column in (
+                    (models.ProductCategory, models.Category, "category_id"),
+                    (models.ProductStore, models.Store, "store_id"),
+                ):
+                    live_association = live_tables[association.table]
+                    live_named = live_tables[named.table]
+                    cursor.execute(
+                        f"INSERT IGNORE INTO {named.table} (name) "
+                        f"SELECT DISTINCT name FROM {live_named} "
+                        f"JOIN {live_association} ON {column} = id "
+                        f"WHERE product_id IN ({placeholders})",
+                        missing_ids,
+                    )
+                    # The ids of the names differ between the live and the
+                    # rebuilt tables
+                    cursor.execute(
+                        f"INSERT IGNORE INTO {association.table} "
+                        f"(product_id, {column}) "
+                        f"SELECT product_id, {named.table}.id "
+                        f"FROM {live_association} "
+                        f"JOIN {live_named} "
+                        f"    ON {live_named}.id = "
+                        f"{live_association}.{column} "
+                        f"JOIN {named.table} "
+                        f"    ON {named.table}.name = {live_named}.name "
+                        f"WHERE product_id IN ({placeholders})",
+                        missing_ids,
+                    )
+            cursor.execute(
+                f"INSERT IGNORE INTO {self.table} (product_id, substitute_id) "
+                f"SELECT product_id, substitute_id FROM {live_favorite}"
+            )
+            cursor.close()
+
     def add_products_to_substitute(self, substitute, *products):
         """Adds products to a substitute."""
         for product in products:
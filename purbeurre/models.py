@@ -26,19 +26,27 @@ class Product:
 
     def get_categories(self, order_by=None, limit=None):
         """Retrieves the categories associated with the product."""
+        categories = Product.manager.get_prefetched(self, "categories")
+        if categories is not None and order_by is None and limit is None:
+            return categories
         return Category.manager.get_categories_by_product(
             self, order_by=order_by, limit=limit
         )
 
     def get_stores(self, order_by=None, limit=None):
         """Retrieves the stores associated with the product."""
-        return Product.manager.get_substitutes_by_product(
+        stores = Product.manager.get_prefetched(self, "stores")
+        if stores is not None and order_by is None and limit is None:
+            return stores
+        return Store.manager.get_stores_by_product(
             self, order_by=order_by, limit=limit
         )
 
     def get_substitutes(self, order_by=None, limit=None):
         """Retrieves the substitutes associated with the product."""
-        return Product.manager.get_substitutes_by_product(self)
+        return Product.manager.get_substitutes_by_product(
+            self, order_by=order_by, limit=limit
+        )
 
     def get_products(self, order_by=None, limit=None):
         """Retrieves the products associated with the substitute."""
@@ -49,10 +57,12 @@ class Product:
     def add_categories(self, *categories):
         """Adds one or more categories to the product."""
         ProductCategory.manager.add_categories_to_product(self, *categories)
+        Product.manager.prefetched.pop(self, None)
 
     def add_stores(self, *stores):
         """Adds one or more stores to the product."""
         ProductStore.manager.add_stores_to_product(self, *stores)
+        Product.manager.prefetched.pop(self, None)
 
     def add_substitutes(self, *substitutes):
         """Registers substitutes associated with a product."""
@@ -198,10 +208,16 @@ class Favorite:
 
     def get_product(self):
         """Retrieves the product associated with the favorite."""
+        products = Favorite.manager.get_prefetched(self, "products")
+        if products is not None and products[0] is not None:
+            return products[0]
         return Product.manager.get_by_id(self.product_id)
 
     def get_substitute(self):
         """Retrieves the substitute associated with the favorite."""
+        products = Favorite.manager.get_prefetched(self, "products")
+        if products is not None and products[1] is not None:
+            return products[1]
         return Product.manager.get_by_id(self.substitute_id)
 
     def __str__(self):
@@ -1,9 +1,8 @@
+from purbeurre.validators import PRODUCT_FIELDS
+
+
 def remove_unuseful_fields(product):
-    useful_fields = {
-        'code', 'product_name', 'categories', 'stores', 'nutriscore_grade',
-        'url', 'generic_name'
-    }
-    for field in product.keys() - useful_fields:
+    for field in product.keys() - PRODUCT_FIELDS:
         del product[field]
 
 
@@ -64,3 +63,19 @@ class ProductNormalizer:
         """
         for product in products:
             self.normalize(product)
+
+    def iter_normalize(self, products):
+        """Lazy counterpart of normalize_all(), normalizes the products
+        one at a time.
+
+        Args:
+            products (iterable): products to normalize, for instance the
+            generator returned by ProductValidator.iter_filter().
+
+        Return:
+            A generator of the normalized products.
+
+        """
+        for product in products:
+            self.normalize(product)
+            yield product
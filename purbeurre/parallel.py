@@ -0,0 +1,213 @@
+"""This module validates and normalizes large batches of products on
+several processors.
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import islice
+from math import ceil
+
+from purbeurre.concurrency import ordered_map
+from purbeurre.normalizers import ProductNormalizer
+from purbeurre.validators import ProductValidator
+
+
+def process_chunk(validators, normalizers, products):
+    """Validates and normalizes a chunk of products in a worker process.
+
+    Args:
+        validators (list): validation functions, the products rejected by
+        one of them are eliminated.
+        normalizers (list): normalization functions applied to the valid
+        products.
+        products (list): products to process.
+
+    Return:
+        The list of the normalized valid products.
+
+    """
+    processed_products = []
+    for product in products:
+        if all(validator(product) for validator in validators):
+            for normalizer in normalizers:
+                normalizer(product)
+            processed_products.append(product)
+    return processed_products
+
+
+def _check_only_rules_differ(instance, base, method):
+    """Raises a ValueError if instance overrides the method of base, the
+    workers only receiving the rule lists.
+    """
+    if instance is None:
+        return
+    if getattr(type(instance), method) is not getattr(base, method):
+        raise ValueError(
+            f"{type(instance).__name__} overrides {method}(), only the "
+            "rule lists of a custom class are run in parallel"
+        )
+
+
+def _chunks(products, chunk_size):
+    """Splits an iterable of products into lists of chunk_size products."""
+    products = iter(products)
+    while True:
+        chunk = list(islice(products, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class ParallelProcessor:
+    """Object validating and normalizing products with a pool of processes.
+
+    The products are split into chunks processed by the rules of a
+    ProductValidator and of a ProductNormalizer. Only their validators and
+    normalizers lists are sent to the workers along with the chunks, so
+    custom rules must be functions defined at the top level of a module,
+    and subclasses overriding is_valid() or normalize() are rejected since
+    the workers would not run them.
+
+    The workers are spawned rather than forked, since the processor runs in
+    the threads of the installation pipeline: a process forked while other
+    threads hold locks, of the connection pool or of the database driver,
+    could wait for them forever.
+    """
+
+    def __init__(
+        self,
+        validator=None,
+        normalizer=None,
+        max_workers=None,
+        chunk_size=None,
+        min_chunk_size=500,
+        max_chunk_size=10000,
+    ):
+        """Initializes a new processor.
+
+        Args:
+            validator (ProductValidator): validator whose rules are applied.
+            Default value is a ProductValidator.
+            normalizer (ProductNormalizer): normalizer whose rules are
+            applied. Default value is a ProductNormalizer.
+            max_workers (int): maximum number of processes, None uses the
+            number of processors.
+            chunk_size (int): number of products per chunk, None adapts it
+            to the number of products.
+            min_chunk_size (int): minimum number of products per chunk, so
+            that a chunk is worth being sent to another process. Smaller
+            batches are processed in the current process. Default value
+            is 500.
+            max_chunk_size (int): maximum number of products per chunk.
+            Default value is 10000.
+
+        Raises:
+            ValueError if the validator overrides is_valid() or the
+            normalizer overrides normalize().
+
+        """
+        _check_only_rules_differ(validator, ProductValidator, "is_valid")
+        _check_only_rules_differ(normalizer, ProductNormalizer, "normalize")
+        self.validator = validator or ProductValidator()
+        self.normalizer = normalizer or ProductNormalizer()
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.min_chunk_size = min_chunk_size
+        self.max_chunk_size = max_chunk_size
+
+    def plan(self, number_of_products=None):
+        """Chooses the number of processes and the size of the chunks.
+
+        Args:
+            number_of_products (int): number of products to process, None
+            if it is not known in advance.
+
+        Return:
+            A (workers, chunk_size) tuple, 1 worker meaning the products are
+            processed in the current process.
+
+        """
+        if number_of_products is None:
+            workers = self.max_workers
+            chunk_size = self.chunk_size or self.max_chunk_size // 4
+            return workers, chunk_size
+
+        # Each worker gets at least min_chunk_size products
+        workers = max(1, min(
+            self.max_workers,
+            number_of_products // self.min_chunk_size,
+        ))
+        # Four chunks per worker balance the load between the workers
+        chunk_size = self.chunk_size or min(
+            self.max_chunk_size,
+            max(self.min_chunk_size, ceil(number_of_products / workers / 4)),
+        )
+        return workers, chunk_size
+
+    def iter_process(self, products):
+        """Validates and normalizes products, processing chunks in parallel.
+
+        Args:
+            products (iterable): products to process. If it is a
+            collection, its size is used to adapt the number of processes
+            and the size of the chunks.
+
+        Return:
+            A generator of the normalized valid products, in the order of
+            the input.
+
+        """
+        try:
+            number_of_products = len(products)
+        except TypeError:
+            number_of_products = None
+        workers, chunk_size = self.plan(number_of_products)
+        process = partial(
+            process_chunk,
+            list(self.validator.validators),
+            list(self.normalizer.normalizers),
+        )
+        chunks = _chunks(products, chunk_size)
+
+        if workers == 1:
+            for chunk in chunks:
+                yield from process(chunk)
+            return
+
+        first_chunk = next(chunks, None)
+        if first_chunk is None:
+            return
+        if len(first_chunk) < chunk_size:
+            # A single small chunk is not worth starting processes
+            yield from process(first_chunk)
+            return
+
+        with ProcessPoolExecutor(
+            workers, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            results = ordered_map(
+                executor,
+                process,
+                _prepend(first_chunk, chunks),
+                window=workers * 2,
+            )
+            for processed_products in results:
+                yield from processed_products
+
+    def process_all(self, products):
+        """Validates and normalizes products, processing chunks in parallel.
+
+        Return:
+            The list of the normalized valid products, in the order of the
+            input.
+
+        """
+        return list(self.iter_process(products))
+
+
+def _prepend(item, iterator):
+    """Yields item then the items of iterator."""
+    yield item
+    yield from iterator
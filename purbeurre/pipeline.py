@@ -0,0 +1,223 @@
+"""This module runs the steps of the installation as a pipeline, so that
+the network, the processors and the database are busy at the same time.
+"""
+
+import queue
+import threading
+import time
+
+# Marks the end of the items in a queue
+_DONE = object()
+
+
+class StageStats:
+    """Statistics of a stage, used to find the bottleneck of a pipeline."""
+
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.busy_time = 0.0
+        self.idle_time = 0.0
+        self.blocked_time = 0.0
+        self.max_depth = 0
+        self._depth_total = 0
+        self._depth_samples = 0
+
+    def record_depth(self, depth):
+        """Records the number of items waiting in the input queue."""
+        self._depth_total += depth
+        self._depth_samples += 1
+        self.max_depth = max(self.max_depth, depth)
+
+    @property
+    def throughput(self):
+        """Number of items handled per second of work."""
+        return self.items / self.busy_time if self.busy_time else 0.0
+
+    @property
+    def mean_depth(self):
+        """Average number of items waiting in the input queue."""
+        if not self._depth_samples:
+            return 0.0
+        return self._depth_total / self._depth_samples
+
+    def __str__(self):
+        return (
+            f"{self.name}: {self.items} items, "
+            f"{self.throughput:.2f} items/s, "
+            f"busy {self.busy_time:.1f}s, "
+            f"waiting for input {self.idle_time:.1f}s, "
+            f"blocked on output {self.blocked_time:.1f}s, "
+            f"queue depth {self.mean_depth:.1f} (max {self.max_depth})"
+        )
+
+
+class Pipeline:
+    """Chain of stages running in their own threads and connected by
+    bounded queues.
+
+    The source stage produces items from an iterable, and each following
+    stage applies its function to the items produced by the previous one.
+    A stage never gets more than queue_size items ahead of the next one, so
+    the memory used stays bounded while every stage works at once.
+    """
+
+    def __init__(self, queue_size=2):
+        """Initializes a pipeline without stages.
+
+        Args:
+            queue_size (int): maximum number of items waiting between two
+            stages. Default value is 2.
+
+        """
+        self.queue_size = queue_size
+        self.stats = []
+        self._source = None
+        self._functions = []
+        self._stop = threading.Event()
+        self._errors = []
+
+    def source(self, name, iterable):
+        """Sets the iterable producing the items of the pipeline."""
+        self._source = iterable
+        self.stats.insert(0, StageStats(name))
+        return self
+
+    def stage(self, name, function):
+        """Adds a stage applying function to each item of the previous
+        stage, its result being the item passed to the next stage.
+        """
+        self._functions.append(function)
+        self.stats.append(StageStats(name))
+        return self
+
+    def _put(self, output, item, stats):
+        """Puts an item in the output queue, unless the pipeline has
+        stopped.
+
+        Return:
+            False if the pipeline has stopped.
+
+        """
+        if output is None:
+            return not self._stop.is_set()
+        start = time.perf_counter()
+        try:
+            while not self._stop.is_set():
+                try:
+                    output.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+        finally:
+            stats.blocked_time += time.perf_counter() - start
+
+    def _get(self, input, stats):
+        """Gets an item from the input queue, or _DONE once the previous
+        stage has finished or the pipeline has stopped.
+        """
+        start = time.perf_counter()
+        try:
+            while not self._stop.is_set():
+                try:
+                    return input.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            return _DONE
+        finally:
+            stats.idle_time += time.perf_counter() - start
+
+    def _run_source(self, output, stats):
+        iterator = iter(self._source)
+        try:
+            while True:
+                start = time.perf_counter()
+                item = next(iterator, _DONE)
+                stats.busy_time += time.perf_counter() - start
+                if item is _DONE or not self._put(output, item, stats):
+                    break
+                stats.items += 1
+        finally:
+            # A generator stopped early releases its resources at once
+            if hasattr(iterator, "close"):
+                iterator.close()
+        self._put(output, _DONE, stats)
+
+    def _run_stage(self, function, input, output, stats):
+        while True:
+            stats.record_depth(input.qsize())
+            item = self._get(input, stats)
+            if item is _DONE:
+                break
+            start = time.perf_counter()
+            result = function(item)
+            stats.busy_time += time.perf_counter() - start
+            stats.items += 1
+            if not self._put(output, result, stats):
+                break
+        self._put(output, _DONE, stats)
+
+    def _target(self, run, *args):
+        """Runs a stage, stopping the whole pipeline if it fails."""
+        try:
+            run(*args)
+        except BaseException as error:
+            self._errors.append(error)
+            self._stop.set()
+
+    def run(self):
+        """Runs the stages until the source is exhausted.
+
+        Raises:
+            The first exception raised by a stage, the other stages being
+            stopped.
+
+        """
+        queues = [
+            queue.Queue(self.queue_size) for function in self._functions
+        ]
+        outputs = queues + [None]
+        threads = [threading.Thread(
+            target=self._target,
+            args=(self._run_source, outputs[0], self.stats[0]),
+            name=self.stats[0].name,
+            daemon=True,
+        )]
+        for index, function in enumerate(self._functions):
+            stats = self.stats[index + 1]
+            threads.append(threading.Thread(
+                target=self._target,
+                args=(
+                    self._run_stage,
+                    function,
+                    queues[index],
+                    outputs[index + 1],
+                    stats,
+                ),
+                name=stats.name,
+                daemon=True,
+            ))
+
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(0.1)
+        finally:
+            # Stops the stages if the main thread is interrupted
+            self._stop.set()
+        if self._errors:
+            raise self._errors[0]
+
+    @property
+    def bottleneck(self):
+        """Name of the stage which worked the longest."""
+        return max(self.stats, key=lambda stats: stats.busy_time).name
+
+    def report(self):
+        """Returns the statistics of the stages as text."""
+        lines = [str(stats) for stats in self.stats]
+        lines.append(f"Bottleneck: {self.bottleneck}")
+        return "\n".join(lines)
@@ -0,0 +1,80 @@
+"""This module validates and normalizes the products in a single pass."""
+
+
+def process_product(product):
+    """Validates a product and builds its normalized version in one pass.
+
+    The result is the same as applying the default rules of
+    ProductValidator and then those of ProductNormalizer, but each field is
+    read only once and the normalized product is built directly instead of
+    being obtained by successive modifications of the original one.
+
+    Args:
+        product (dict): dictionary containing product data, it is not
+        modified.
+
+    Return:
+        The normalized product, or None if the product is not valid.
+
+    """
+    try:
+        code = product["code"]
+        name = product["product_name"]
+        categories = product["categories"]
+        stores = product["stores"]
+        nutriscore = product["nutriscore_grade"]
+        url = product["url"]
+        description = product["generic_name"]
+    except KeyError:
+        return None
+    values = (code, name, categories, stores, nutriscore, url, description)
+    for value in values:
+        if isinstance(value, str) and not value.strip():
+            return None
+
+    return {
+        "id": code,
+        "name": name.lower(),
+        "url": url,
+        "nutriscore": nutriscore.lower(),
+        "description": description.lower(),
+        "categories": [
+            category.strip() for category in categories.lower().split(",")
+        ],
+        "stores": [store.strip() for store in stores.lower().split(",")],
+    }
+
+
+class ProductProcessor:
+    """Object validating and normalizing products in a single pass.
+
+    It applies the default rules of ProductValidator and ProductNormalizer,
+    these classes remain the way to use custom rules.
+    """
+
+    def process(self, product):
+        """Validates and normalizes a product.
+
+        Args:
+            product (dict): dictionary containing product data.
+
+        Return:
+            The normalized product, or None if the product is not valid.
+
+        """
+        return process_product(product)
+
+    def iter_process(self, products):
+        """Validates and normalizes products one at a time.
+
+        Args:
+            products (iterable): products to process.
+
+        Return:
+            A generator of the normalized versions of the valid products.
+
+        """
+        for product in products:
+            product = process_product(product)
+            if product is not None:
+                yield product
@@ -0,0 +1,108 @@
+"""Local stand-in for the openfoodfacts search API used by the tests."""
+
+import gzip
+import json
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Failure answering a page with a body cut off in the middle of a product
+TRUNCATED = "truncated"
+
+
+def make_product(page, index):
+    """Builds a fake openfoodfacts product."""
+    return {
+        "code": f"{page:04d}{index:04d}",
+        "product_name": f"Product {page}-{index}",
+        "categories": "Biscuits,Biscuits au chocolat",
+        "stores": "Auchan,Carrefour",
+        "nutriscore_grade": "c",
+        "url": f"https://fr.openfoodfacts.org/product/{page}{index}",
+        "generic_name": "Biscuits",
+        "energy_100g": 2000,
+        "ingredients_text": "farine, sucre, chocolat",
+        # The products of the first pages are the most recently modified
+        "last_modified_t": 1600000000 - page * 10000 - index,
+    }
+
+
+class SearchHandler(BaseHTTPRequestHandler):
+    """Answers search.pl requests with generated products."""
+
+    def do_GET(self):
+        params = {
+            key: values[0]
+            for key, values in parse_qs(urlparse(self.path).query).items()
+        }
+        self.server.requests.append(params)
+        page = int(params.get("page", 1))
+        page_size = int(params.get("page_size", 20))
+        failures = self.server.failures.get(page)
+        if failures:
+            failure = failures.pop(0)
+            if failure == TRUNCATED:
+                body = b'{"count": 1, "products": [{"code": "00'
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+            self.send_response(failure)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        etag = f'"{page}-{page_size}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        products = [make_product(page, index) for index in range(page_size)]
+        if "fields" in params:
+            fields = params["fields"].split(",")
+            products = [
+                {field: product[field] for field in fields}
+                for product in products
+            ]
+        body = json.dumps({
+            "count": page_size * 100,
+            "page": page,
+            "page_size": page_size,
+            "products": products,
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("ETag", etag)
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@contextmanager
+def serve(handler=SearchHandler, failures=None):
+    """Runs a local server in a thread and yields the url of search.pl.
+
+    Args:
+        handler (class): class handling the requests.
+        failures (dict): statuses returned, in order, for a page before it
+        is served normally. TRUNCATED sends a body cut off instead.
+
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.requests = []
+    server.failures = failures or {}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server, f"http://127.0.0.1:{server.server_port}/cgi/search.pl"
+    finally:
+        server.shutdown()
+        server.server_close()
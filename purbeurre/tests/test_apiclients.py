@@ -1,4 +1,17 @@
-from purbeurre.apiclients import OpenfoodfactsClient
+import json
+import time
+
+import requests
+
+from purbeurre.apiclients import (
+    OpenfoodfactsClient,
+    OpenfoodfactsMultiClient,
+    TruncatedResponseError,
+    is_transient,
+    iter_json_array,
+)
+from purbeurre.validators import BarcodeSet
+from purbeurre.tests.off_server import TRUNCATED, serve
 
 
 def test_get_products_by_popularity_downloads_the_right_number_of_products():
@@ -7,3 +20,183 @@ def test_get_products_by_popularity_downloads_the_right_number_of_products():
         page_size=20, number_of_pages=3
     )
     assert len(products) == 60
+
+
+def test_concurrent_download_keeps_the_order_of_the_pages():
+    with serve() as (server, url):
+        client = OpenfoodfactsClient(max_workers=4, url=url)
+        products = client.get_products_by_popularity(
+            page_size=20, number_of_pages=6
+        )
+    assert len(products) == 120
+    assert [product["code"] for product in products[::20]] == [
+        f"{page:04d}0000" for page in range(1, 7)
+    ]
+
+
+def test_iter_products_yields_the_products_page_by_page():
+    with serve() as (server, url):
+        client = OpenfoodfactsClient(max_workers=2, url=url)
+        products = client.iter_products(page_size=20, number_of_pages=5)
+        first_product = next(products)
+        # Only the pages in the download window have been requested
+        assert len(server.requests) <= 3
+        assert len([first_product, *products]) == 100
+
+
+def test_iter_json_array_decodes_items_cut_across_chunks():
+    products = [
+        {"code": str(i), "product_name": "Pâte à tartiner"} for i in range(50)
+    ]
+    document = json.dumps({"count": 50, "products": products}).encode()
+    # Chunks of 7 bytes cut keys, values and UTF-8 characters in two
+    chunks = (document[i:i+7] for i in range(0, len(document), 7))
+    assert list(iter_json_array(chunks, "products")) == products
+
+
+def test_downloaded_products_only_keep_the_useful_fields():
+    with serve() as (server, url):
+        client = OpenfoodfactsClient(url=url)
+        products = client.get_products_by_popularity(page_size=20)
+    assert "energy_100g" not in products[0]
+    assert "product_name" in products[0]
+
+
+def test_only_the_useful_fields_are_requested_compressed():
+    with serve() as (server, url):
+        client = OpenfoodfactsClient(url=url)
+        products = client.get_products_by_popularity(
+            page_size=100, number_of_pages=2
+        )
+    assert set(server.requests[0]["fields"].split(",")) == client.fields
+    assert len(products) == 200
+    # 100 products weigh more than 10kB once decompressed
+    assert 0 < client.bytes_transferred[1] < 10000
+    assert set(client.bytes_transferred) == {1, 2}
+
+
+def test_iter_pages_skips_the_requested_pages():
+    with serve() as (server, url):
+        client = OpenfoodfactsClient(max_workers=2, url=url)
+        pages = client.iter_pages(
+            page_size=20, number_of_pages=4, skip_pages={1, 3}
+        )
+        assert [page for page, products in pages] == [2, 4]
+    assert sorted(int(params["page"]) for params in server.requests) == [2, 4]
+
+
+def test_pages_are_retried_after_transient_errors():
+    failures = {1: [503, 429], 2: [502]}
+    with serve(failures=failures) as (server, url):
+        client = OpenfoodfactsClient(max_workers=2, url=url, backoff=0.01)
+        products = client.get_products_by_popularity(
+            page_size=20, number_of_pages=3
+        )
+    assert len(products) == 60
+    assert len(server.requests) == 6
+    assert client.failed_pages == set()
+
+
+def test_truncated_pages_are_retried():
+    failures = {2: [TRUNCATED]}
+    with serve(failures=failures) as (server, url):
+        client = OpenfoodfactsClient(url=url, backoff=0.01)
+        products = client.get_products_by_popularity(
+            page_size=20, number_of_pages=2
+        )
+    assert len(products) == 40
+    assert len(server.requests) == 3
+    assert client.failed_pages == set()
+
+
+def test_network_failures_and_truncated_bodies_are_transient():
+    assert is_transient(requests.exceptions.ConnectionError())
+    assert is_transient(requests.exceptions.Timeout())
+    assert is_transient(requests.exceptions.ChunkedEncodingError())
+    assert is_transient(TruncatedResponseError())
+    assert not is_transient(requests.exceptions.InvalidURL())
+
+
+def test_a_failing_page_does_not_discard_the_other_pages():
+    failures = {2: [500] * 10, 3: [404]}
+    with serve(failures=failures) as (server, url):
+        client = OpenfoodfactsClient(
+            max_workers=2, url=url, max_retries=2, backoff=0.01
+        )
+        products = client.get_products_by_popularity(
+            page_size=20, number_of_pages=4
+        )
+    assert len(products) == 40
+    assert client.failed_pages == {2, 3}
+    # 404 is not a transient error, it is not retried
+    assert [params["page"] for params in server.requests].count("3") == 1
+
+
+def test_multi_client_provides_the_preferred_endpoint_first():
+    with serve() as (server, url):
+        client = OpenfoodfactsMultiClient(langs=("fr", "en"), url=url)
+        pages = list(client.iter_pages(page_size=20, number_of_pages=2))
+    assert [page for page, products in pages] == [
+        "fr:1", "fr:2", "en:1", "en:2"
+    ]
+    assert len(server.requests) == 4
+    assert set(client.bytes_transferred) == {"fr:1", "fr:2", "en:1", "en:2"}
+
+
+def test_products_of_several_endpoints_are_merged_by_barcode():
+    with serve() as (server, url):
+        client = OpenfoodfactsMultiClient(langs=("fr", "en"), url=url)
+        products = BarcodeSet().iter_unique(
+            client.iter_products(page_size=20, number_of_pages=2)
+        )
+        assert len(list(products)) == 40
+
+
+def test_iter_modified_pages_stops_at_the_first_older_product():
+    since = 1600000000 - 2 * 10000 - 5
+    with serve() as (server, url):
+        client = OpenfoodfactsClient(url=url, max_workers=2)
+        pages = list(client.iter_modified_pages(since, page_size=20))
+
+    assert [page for page, products in pages] == [1, 2]
+    assert len(pages[1][1]) == 6
+    assert all(
+        product["last_modified_t"] >= since
+        for page, products in pages for product in products
+    )
+    assert server.requests[0]["sort_by"] == "last_modified_t"
+    assert "last_modified_t" in server.requests[0]["fields"]
+
+
+class UnreachableClient(OpenfoodfactsClient):
+    """Client whose every page fails, as during an outage."""
+
+    def _get_page(self, page, page_size, sort_by=None):
+        raise requests.exceptions.ConnectionError("server unreachable")
+
+
+def test_iter_modified_pages_stops_at_the_first_failed_page():
+    client = UnreachableClient(max_workers=2, max_retries=1, backoff=0.01)
+
+    pages = list(client.iter_modified_pages(0, page_size=20))
+
+    assert pages == []
+    assert 1 in client.failed_pages
+    # Only the pages downloaded in advance were attempted
+    assert len(client.failed_pages) <= client.max_workers + 1
+
+
+def test_multi_client_endpoints_share_the_rate_limit():
+    with serve() as (server, url):
+        client = OpenfoodfactsMultiClient(
+            langs=("fr", "en", "world"), url=url, rate_limit=20
+        )
+        start = time.monotonic()
+        list(client.iter_pages(page_size=20, number_of_pages=2))
+        elapsed = time.monotonic() - start
+
+    assert len(server.requests) == 6
+    # 20 requests per second for all the endpoints: the first request is
+    # sent at once, the 5 others take 50ms each
+    assert elapsed >= 0.25
+    assert len({id(endpoint.rate_limiter) for endpoint in client.clients}) == 1
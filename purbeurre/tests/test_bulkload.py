@@ -0,0 +1,85 @@
+from purbeurre.bulkload import BulkLoader, escape
+from purbeurre.models import (
+    Category,
+    Product,
+    ProductCategory,
+    ProductStore,
+    Store,
+)
+
+
+def make_product(id, categories, stores=("carrefour",)):
+    return {
+        "id": id,
+        "name": "pâte à tartiner",
+        "url": f"https://fr.openfoodfacts.org/produit/{id}",
+        "nutriscore": "e",
+        "description": "pâte à tartiner\taux noisettes",
+        "categories": list(categories),
+        "stores": list(stores),
+    }
+
+
+def test_escape_follows_the_format_of_load_data():
+    assert escape(None) == "\\N"
+    assert escape(42) == "42"
+    assert escape("a\tb\nc\\d") == "a\\tb\\nc\\\\d"
+
+
+def test_bulkloader_writes_each_name_once_and_skips_duplicates():
+    with BulkLoader() as loader:
+        assert loader.add(make_product("1", ["Pâtes", "pates", "pizzas"]))
+        assert loader.add(make_product("2", ["pizzas"]))
+        assert not loader.add(make_product("0002", ["pizzas"]))
+        files = loader._files
+
+        assert files["products"].rows == 2
+        # The names equal for the collation are merged by MySQL
+        assert files["categories"].rows == 3
+        assert files["stores"].rows == 1
+        assert files["product_categories"].rows == 4
+        assert files["product_stores"].rows == 2
+
+
+def delete_catalog():
+    ProductCategory.manager.delete_all()
+    ProductStore.manager.delete_all()
+    Product.manager.delete_all()
+    Category.manager.delete_all()
+    Store.manager.delete_all()
+
+
+def test_bulkloader_loads_the_products():
+    delete_catalog()
+    with BulkLoader() as loader:
+        loader.add_all([
+            make_product("1", ["pâtes à tartiner", "Pâtes à tartiner"]),
+            make_product("2", ["pâtes à tartiner", "biscuits"]),
+        ])
+        rows = loader.load()
+    categories = Category.manager.get_all()
+    product = Product.manager.get_by_id(id=1)
+    delete_catalog()
+
+    assert rows[Product.table] == 2
+    assert len(categories) == 2
+    assert product.description == "pâte à tartiner\taux noisettes"
+
+
+def test_bulkloader_merges_the_names_equal_for_the_collation():
+    delete_catalog()
+    with BulkLoader() as loader:
+        loader.add_all([
+            make_product("1", ["Œufs", "oeufs"]),
+            make_product("2", ["oeufs"], stores=("Carrefour ",)),
+        ])
+        rows = loader.load()
+    categories = Category.manager.get_all()
+    first = Product.manager.get_by_id(id=1).get_categories()
+    second = Product.manager.get_by_id(id=2).get_categories()
+    delete_catalog()
+
+    assert rows[Store.table] == 1
+    assert len(categories) == 1
+    assert [category.id for category in first] == [categories[0].id]
+    assert [category.id for category in second] == [categories[0].id]
@@ -0,0 +1,67 @@
+import os
+import tempfile
+
+from purbeurre.apiclients import OpenfoodfactsClient
+from purbeurre.cache import LRUCache, ResponseCache
+from purbeurre.tests.off_server import serve
+
+
+def test_cached_pages_are_not_downloaded_again():
+    with tempfile.TemporaryDirectory() as directory, serve() as (server, url):
+        cache = ResponseCache(directory)
+        client = OpenfoodfactsClient(url=url, cache=cache)
+        first_products = client.get_products_by_popularity(
+            page_size=20, number_of_pages=2
+        )
+        client = OpenfoodfactsClient(url=url, cache=cache)
+        products = client.get_products_by_popularity(
+            page_size=20, number_of_pages=2
+        )
+    assert len(server.requests) == 2
+    assert products == first_products
+    assert client.bytes_transferred == {1: 0, 2: 0}
+
+
+def test_stale_pages_are_revalidated_with_their_etag():
+    with tempfile.TemporaryDirectory() as directory, serve() as (server, url):
+        cache = ResponseCache(directory, ttl=0)
+        client = OpenfoodfactsClient(url=url, cache=cache)
+        client.get_products_by_popularity(page_size=20)
+        products = client.get_products_by_popularity(page_size=20)
+    assert len(server.requests) == 2
+    assert len(products) == 20
+    assert client.bytes_transferred[1] == 0
+
+
+def test_least_recently_used_responses_are_evicted():
+    with tempfile.TemporaryDirectory() as directory:
+        cache = ResponseCache(directory, max_size=3000)
+        for page in range(1, 4):
+            with cache.store("http://off", {"page": page}) as write:
+                write(os.urandom(2000))
+        assert cache.get("http://off", {"page": 1}) is None
+        assert cache.get("http://off", {"page": 3}) is not None
+
+
+def test_lru_cache_evicts_the_least_recently_used_item():
+    cache = LRUCache(2)
+    cache.put("pizzas", 1)
+    cache.put("biscuits", 2)
+    cache.get("pizzas")
+    cache.put("pâtes", 3)
+
+    assert len(cache) == 2
+    assert cache.get("biscuits") is None
+    assert cache.get("pizzas") == 1
+    assert cache.get("pâtes") == 3
+
+
+def test_lru_cache_counts_hits_and_misses():
+    cache = LRUCache(10)
+    cache.put("pizzas", 1)
+    cache.get("pizzas")
+    cache.get("pizzas")
+    cache.get("biscuits")
+
+    assert cache.hits == 2
+    assert cache.misses == 1
@@ -0,0 +1,113 @@
+import os
+import tempfile
+
+from purbeurre.checkpoints import InstallCheckpoint, SyncState
+
+
+def test_checkpoint_is_reloaded_by_the_next_run():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "install.checkpoint")
+        checkpoint = InstallCheckpoint(path, page_size=20)
+        checkpoint.mark_product_saved("1")
+        checkpoint.mark_page_done(1)
+        checkpoint.mark_product_saved("2")
+        checkpoint.mark_product_pending("3")
+        checkpoint.close()
+
+        checkpoint = InstallCheckpoint(path, page_size=20)
+        assert checkpoint.resumed
+        assert checkpoint.is_page_done(1)
+        assert not checkpoint.is_page_done(2)
+        assert checkpoint.is_product_saved("2")
+        assert checkpoint.is_product_pending("3")
+        checkpoint.close()
+
+
+def test_truncated_last_record_is_ignored():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "install.checkpoint")
+        checkpoint = InstallCheckpoint(path, page_size=20)
+        checkpoint.mark_page_done(1)
+        checkpoint.close()
+        with open(path, "a") as file:
+            file.write('{"page": ')
+
+        checkpoint = InstallCheckpoint(path, page_size=20)
+        assert checkpoint.pages == {1}
+        checkpoint.close()
+
+
+def test_records_appended_after_a_truncated_line_are_kept():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "install.checkpoint")
+        checkpoint = InstallCheckpoint(path, page_size=20)
+        checkpoint.mark_page_done(1)
+        checkpoint.close()
+        with open(path, "a") as file:
+            file.write('{"page": ')
+
+        # The resumed run uses another page size, recorded first
+        checkpoint = InstallCheckpoint(path, page_size=100)
+        checkpoint.mark_page_done(2)
+        checkpoint.close()
+
+        checkpoint = InstallCheckpoint(path, page_size=100)
+        assert checkpoint.pages == {2}
+        checkpoint.close()
+
+
+def test_pages_are_forgotten_when_the_page_size_changes():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "install.checkpoint")
+        checkpoint = InstallCheckpoint(path, page_size=20)
+        checkpoint.mark_product_saved("1")
+        checkpoint.mark_page_done(1)
+        checkpoint.close()
+
+        checkpoint = InstallCheckpoint(path, page_size=100)
+        assert not checkpoint.is_page_done(1)
+        assert checkpoint.is_product_saved("1")
+        checkpoint.close()
+
+        checkpoint = InstallCheckpoint(path, page_size=100)
+        assert not checkpoint.is_page_done(1)
+        checkpoint.clear()
+        assert not os.path.exists(path)
+
+
+def test_checkpoint_can_be_reused_after_being_cleared():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "install.checkpoint")
+        checkpoint = InstallCheckpoint(path, page_size=20)
+        checkpoint.mark_page_done(1)
+        checkpoint.clear()
+        checkpoint.mark_page_done(2)
+        checkpoint.close()
+
+        checkpoint = InstallCheckpoint(path, page_size=20)
+        assert checkpoint.pages == {2}
+        checkpoint.close()
+
+
+def test_batches_of_products_are_recorded():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "install.checkpoint")
+        checkpoint = InstallCheckpoint(path, page_size=20)
+        checkpoint.mark_products_pending(["1", "2"])
+        checkpoint.mark_products_saved(["1", "2"])
+        checkpoint.mark_products_pending(["3", "4"])
+        checkpoint.close()
+
+        checkpoint = InstallCheckpoint(path, page_size=20)
+        assert checkpoint.products == {"1", "2"}
+        assert checkpoint.pending_products == {"3", "4"}
+        checkpoint.close()
+
+
+def test_sync_state_is_reloaded_by_the_next_run():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "sync.json")
+        assert SyncState(path).get("fr") is None
+        SyncState(path).set("fr", 1600000000)
+
+        assert SyncState(path).get("fr") == 1600000000
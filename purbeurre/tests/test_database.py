@@ -0,0 +1,217 @@
+import subprocess
+import sys
+import threading
+
+import pytest
+from mysql.connector import InterfaceError
+
+from purbeurre.database import (
+    ConnectionPool,
+    ShadowTables,
+    create_constraints,
+    create_tables,
+    drop_tables,
+)
+from purbeurre.models import Category, Favorite, Product, ProductCategory
+
+
+class FakeConnection:
+    def __init__(self):
+        self.healthy = True
+        self.closed = False
+        self.in_transaction = False
+        self.commits = 0
+        self.rollbacks = 0
+
+    def commit(self):
+        self.commits += 1
+
+    def ping(self, reconnect=False):
+        if not self.healthy:
+            raise InterfaceError("connection lost")
+
+    def rollback(self):
+        self.in_transaction = False
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = True
+
+
+class FakePool(ConnectionPool):
+    def _connect(self):
+        return FakeConnection()
+
+
+def test_connection_pool_reuses_the_connection_of_a_thread():
+    pool = FakePool(2)
+
+    with pool.connection() as outer:
+        with pool.connection() as inner:
+            pass
+    with pool.connection() as again:
+        pass
+
+    assert inner is outer
+    assert again is outer
+
+
+def test_connection_pool_gives_each_thread_its_own_connection():
+    pool = FakePool(2)
+    connections = []
+
+    def use_connection():
+        with pool.connection() as connection:
+            connections.append(connection)
+
+    with pool.connection() as connection:
+        thread = threading.Thread(target=use_connection)
+        thread.start()
+        thread.join()
+
+    assert connections[0] is not connection
+
+
+def test_connection_pool_waits_for_a_free_connection_up_to_its_timeout():
+    pool = FakePool(1, timeout=0.1)
+
+    pool.acquire()
+
+    with pytest.raises(TimeoutError):
+        pool.acquire()
+
+
+def test_connection_pool_replaces_the_broken_connections():
+    pool = FakePool(1)
+    broken = pool.acquire()
+    broken.healthy = False
+    broken.in_transaction = True
+    pool.release(broken)
+
+    connection = pool.acquire()
+
+    assert connection is not broken
+    assert broken.closed
+
+
+def test_nested_transactions_are_committed_once_at_the_end():
+    pool = FakePool(1)
+
+    with pool.transaction() as outer:
+        with pool.transaction() as inner:
+            pass
+        commits_in_block = outer.commits
+
+    assert inner is outer
+    assert commits_in_block == 0
+    assert outer.commits == 1
+
+
+def test_failed_transactions_are_rolled_back():
+    pool = FakePool(1)
+
+    with pytest.raises(RuntimeError):
+        with pool.transaction() as connection:
+            with pool.transaction():
+                raise RuntimeError("interrupted")
+
+    assert connection.commits == 0
+    assert connection.rollbacks == 1
+    assert not pool.in_transaction()
+
+
+def test_importing_the_models_neither_connects_nor_imports_mysql():
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys, purbeurre.models; "
+            "print('mysql.connector' in sys.modules)",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    assert result.stdout.strip() == "False"
+
+
+def make_product(id):
+    return Product(id=id, name="nutella", url="http", nutriscore="e")
+
+
+def test_shadow_tables_replace_the_live_tables_and_keep_the_favorites():
+    Product.manager.bulk_create([make_product(1), make_product(2)])
+    nutella = Product.manager.get_by_id(1)
+    nutella.add_categories(Category.manager.create(name="pâtes à tartiner"))
+    Favorite.manager.create(product=1, substitute=2)
+
+    with ShadowTables():
+        Product.manager.bulk_create([make_product(2), make_product(3)])
+        assert Product.manager.table == "product_shadow"
+
+    products = Product.manager.get_all()
+    favorites = Favorite.manager.get_all()
+    categories = nutella.get_categories()
+    Favorite.manager.delete_all()
+    ProductCategory.manager.delete_all()
+    Category.manager.delete_all()
+    Product.manager.delete_all()
+
+    assert Product.manager.table == "product"
+    # The product of the favorite is kept with its categories
+    assert sorted(product.id for product in products) == [1, 2, 3]
+    assert len(favorites) == 1
+    assert [category.name for category in categories] == ["pâtes à tartiner"]
+
+
+def test_abandoned_shadow_tables_leave_the_live_tables_untouched():
+    Product.manager.bulk_create([make_product(1)])
+
+    with ShadowTables() as shadow:
+        Product.manager.bulk_create([make_product(2)])
+        shadow.abandon()
+
+    products = Product.manager.get_all()
+    Product.manager.delete_all()
+
+    assert [product.id for product in products] == [1]
+
+
+def test_create_constraints_reports_the_faulty_rows():
+    with ShadowTables() as shadow:
+        drop_tables()
+        create_tables(constraints=False)
+        Product.manager.bulk_create([make_product(1)])
+        pates = Category.manager.create(name="pâtes à tartiner")
+        # Duplicate association and association to an unknown product
+        ProductCategory.manager.bulk_create([
+            ProductCategory(product=1, category=pates.id),
+            ProductCategory(product=1, category=pates.id),
+            ProductCategory(product=2, category=pates.id),
+        ])
+        problems = create_constraints()
+        shadow.abandon()
+
+    assert problems == {
+        "product_category_shadow": {
+            "duplicate (product_id, category_id)": 1,
+            "product_id missing from product_shadow": 1,
+        },
+    }
+
+
+def test_create_constraints_builds_the_keys_of_sound_tables():
+    with ShadowTables() as shadow:
+        drop_tables()
+        create_tables(constraints=False)
+        Product.manager.bulk_create([make_product(1), make_product(2)])
+        Favorite.manager.create(product=1, substitute=2)
+        problems = create_constraints()
+        # The primary key now ignores a duplicate favorite
+        Favorite.manager.create(product=1, substitute=2)
+        favorites = Favorite.manager.get_all()
+        shadow.abandon()
+
+    assert problems == {}
+    assert len(favorites) == 1
@@ -0,0 +1,99 @@
+import gzip
+import json
+import os
+import tempfile
+
+from purbeurre.dumps import iter_dump_products
+from purbeurre.tests import test_data as data
+
+FRENCH_BISCUITS = {
+    **data.VALID_PRODUCT,
+    "code": "1",
+    "categories": "Biscuits, Biscuits au chocolat",
+    "countries": "France",
+    "countries_tags": ["en:france"],
+}
+BELGIAN_PIZZA = {
+    **data.VALID_PRODUCT,
+    "code": "2",
+    "categories": "Pizzas",
+    "countries": "Belgique",
+    "countries_tags": ["en:belgium"],
+}
+
+BRITISH_BISCUITS = {
+    **data.VALID_PRODUCT,
+    "code": "3",
+    "categories": "Biscuits",
+    "countries": "Royaume-Uni",
+    "countries_tags": ["en:united-kingdom"],
+}
+CSV_COLUMNS = [
+    "code", "product_name", "generic_name", "url", "categories",
+    "stores", "countries", "nutriscore_grade",
+]
+
+
+def write_jsonl(path, products):
+    with open(path, "w", encoding="utf-8") as file:
+        for product in products:
+            file.write(json.dumps(product, ensure_ascii=False) + "\n")
+
+
+def write_csv(path, products):
+    with open(path, "w", encoding="utf-8") as file:
+        file.write("\t".join(CSV_COLUMNS) + "\n")
+        for product in products:
+            file.write(
+                "\t".join(str(product[column]) for column in CSV_COLUMNS)
+                + "\n"
+            )
+
+
+def test_products_are_read_from_a_compressed_jsonl_export():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "products.jsonl.gz")
+        with gzip.open(path, "wt", encoding="utf-8") as file:
+            for product in (FRENCH_BISCUITS, BELGIAN_PIZZA):
+                file.write(json.dumps(product) + "\n")
+
+        products = list(iter_dump_products(path))
+        french_products = list(iter_dump_products(path, countries=["france"]))
+
+    assert [product["code"] for product in products] == ["1", "2"]
+    assert "countries" not in products[0]
+    assert [product["code"] for product in french_products] == ["1"]
+
+
+def test_products_are_read_from_a_csv_export():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "products.csv")
+        write_csv(path, (FRENCH_BISCUITS, BELGIAN_PIZZA))
+
+        products = list(iter_dump_products(
+            path, categories=["biscuits au chocolat"]
+        ))
+
+    assert len(products) == 1
+    assert products[0]["code"] == "1"
+    assert products[0]["stores"] == FRENCH_BISCUITS["stores"]
+
+
+def test_localized_countries_select_the_same_products_in_both_formats():
+    products = (FRENCH_BISCUITS, BELGIAN_PIZZA, BRITISH_BISCUITS)
+    with tempfile.TemporaryDirectory() as directory:
+        jsonl_path = os.path.join(directory, "products.jsonl")
+        csv_path = os.path.join(directory, "products.csv")
+        write_jsonl(jsonl_path, products)
+        write_csv(csv_path, products)
+
+        selections = [
+            [
+                product["code"]
+                for product in iter_dump_products(path, countries=[country])
+            ]
+            for path in (jsonl_path, csv_path)
+            for country in ("Royaume-Uni", "royaume uni")
+        ]
+
+    assert selections == [["3"], ["3"], ["3"], ["3"]]
@@ -1,5 +1,13 @@
 
-from purbeurre.models import Category, Product, ProductCategory
+import pytest
+
+from purbeurre.database import transaction
+from purbeurre.models import (
+    Category,
+    Favorite,
+    Product,
+    ProductCategory,
+)
 
 
 def test_basemanager_get_all_works_correctly():
@@ -132,3 +140,254 @@ def test_categorymanager_gets_categories_by_product_correctly():
     Category.manager.delete_all()
 
     assert len(categories) == 2
+
+
+def test_basemanager_bulk_create_saves_every_instance():
+    products = Product.manager.bulk_create(
+        (
+            Product(
+                id=id,
+                name=f"Pizza {id}",
+                url="http",
+                nutriscore="E",
+                description="Info sur le produit",
+            )
+            for id in range(1, 6)
+        ),
+        batch_size=2,
+    )
+
+    saved_products = Product.manager.get_all()
+    Product.manager.delete_all()
+
+    assert len(products) == 5
+    assert len(saved_products) == 5
+
+
+def test_namedmanager_bulk_create_sets_the_ids():
+    pizza = Category.manager.create(name="Pizza")
+    categories = Category.manager.bulk_create(
+        [Category(name="Pizza"), Category(name="Pâte à tartiner")]
+    )
+
+    saved_categories = Category.manager.get_all()
+    Category.manager.delete_all()
+
+    assert categories[0].id == pizza.id
+    assert categories[1].id is not None
+    assert len(saved_categories) == 2
+
+
+def test_namedmanager_resolves_cached_names_without_query():
+    Category.manager.delete_all()
+    ids = Category.manager.resolve_ids(["pizzas", "biscuits"])
+    misses = Category.manager.ids.misses
+    cached_ids = Category.manager.resolve_ids(["biscuits", "pizzas"])
+    Category.manager.delete_all()
+
+    assert cached_ids == ids
+    assert Category.manager.ids.misses == misses
+    assert len(Category.manager.ids) == 0
+
+
+def test_namedmanager_preload_fills_the_cache():
+    Category.manager.bulk_create([Category(name="pizzas")])
+    Category.manager.ids.clear()
+    Category.manager.preload()
+    pizzas = Category.manager.create(name="pizzas")
+    Category.manager.delete_all()
+
+    assert pizzas.id is not None
+    assert Category.manager.ids.hits >= 1
+
+
+def test_productmanager_bulk_upsert_only_writes_the_changes():
+    Product.manager.bulk_create([
+        Product(id=1, name="nutella", url="http", nutriscore="e"),
+        Product(id=2, name="pizza", url="http", nutriscore="c"),
+    ])
+    written_products = Product.manager.bulk_upsert([
+        Product(id=1, name="nutella", url="http", nutriscore="e"),
+        Product(id=2, name="pizza", url="http", nutriscore="b"),
+        Product(id=3, name="gratin", url="http", nutriscore="a"),
+    ])
+    pizza = Product.manager.get_by_id(2)
+    Product.manager.delete_all()
+
+    assert [product.id for product in written_products] == [2, 3]
+    assert pizza.nutriscore == "b"
+
+
+def test_associationmanager_replace_only_writes_the_differences():
+    nutella = Product.manager.create(
+        id=1, name="nutella", url="http", nutriscore="e"
+    )
+    pates, chocolat, petit_dejeuner = Category.manager.bulk_create([
+        Category(name="pâtes à tartiner"),
+        Category(name="chocolat"),
+        Category(name="petit-déjeuner"),
+    ])
+    nutella.add_categories(pates, chocolat)
+    changes = ProductCategory.manager.replace(
+        {nutella.id: {pates.id, petit_dejeuner.id}}
+    )
+    category_ids = ProductCategory.manager.get_related_ids([nutella.id])
+    ProductCategory.manager.delete_all()
+    Category.manager.delete_all()
+    Product.manager.delete_all()
+
+    assert changes == (1, 1)
+    assert category_ids == {1: {pates.id, petit_dejeuner.id}}
+
+
+def test_productmanager_prune_keeps_the_favorites():
+    Product.manager.bulk_create([
+        Product(id=id, name="nutella", url="http", nutriscore="e")
+        for id in (1, 2, 3, 4)
+    ])
+    Favorite.manager.create(product=2, substitute=3)
+    pruned = Product.manager.prune(keep=["1"])
+    products = Product.manager.get_all()
+    Favorite.manager.delete_all()
+    Product.manager.delete_all()
+
+    assert pruned == 1
+    assert sorted(product.id for product in products) == [1, 2, 3]
+
+
+def test_productmanager_filter_existing_ids_keeps_the_stored_ids():
+    Product.manager.create(id=1, name="nutella", url="http", nutriscore="e")
+    existing_ids = Product.manager.filter_existing_ids(["0001", "2", "abc"])
+    Product.manager.delete_all()
+
+    assert existing_ids == {"0001"}
+
+
+def test_transaction_rolls_back_every_manager_call_of_the_block():
+    with pytest.raises(RuntimeError):
+        with transaction():
+            Product.manager.create(
+                id=1, name="nutella", url="http", nutriscore="e"
+            )
+            Category.manager.create(name="pâtes à tartiner")
+            raise RuntimeError("interrupted")
+
+    products = Product.manager.get_all()
+    categories = Category.manager.get_all()
+
+    assert products == []
+    assert categories == []
+    # The id of the rolled back category is not cached
+    assert Category.manager.ids.get("pâtes à tartiner") is None
+
+
+def test_basemanager_rejects_unsafe_order_by():
+    with pytest.raises(ValueError):
+        Product.manager.get_all(order_by=["name; DROP TABLE product"])
+    with pytest.raises(ValueError):
+        Product.manager.get_all(order_by=["(SELECT 1)"])
+
+
+def test_basemanager_builds_each_query_shape_once():
+    built = []
+
+    def build():
+        built.append(True)
+        return "SELECT * FROM product"
+
+    first = Product.manager._query("test", build, ["name DESC"], [10])
+    second = Product.manager._query("test", build, ["name DESC"], [20])
+    other = Product.manager._query("test", build, ["RAND()"], [10])
+
+    assert second is first
+    assert first == "SELECT * FROM product ORDER BY name DESC LIMIT %s"
+    assert other == "SELECT * FROM product ORDER BY RAND() LIMIT %s"
+    assert len(built) == 2
+
+
+def test_basemanager_get_by_id_reuses_the_instances_already_retrieved():
+    pizzas = Category.manager.create(name="pizzas")
+    Category.manager.identity_map.clear()
+    hits = Category.manager.identity_map.hits
+
+    first = Category.manager.get_by_id(pizzas.id)
+    second = Category.manager.get_by_id(pizzas.id)
+    Category.manager.delete_all()
+
+    assert second is first
+    assert Category.manager.identity_map.hits == hits + 1
+    assert len(Category.manager.identity_map) == 0
+
+
+def test_basemanager_save_invalidates_the_identity_map():
+    pizzas = Category.manager.create(name="pizzas")
+    cached_pizzas = Category.manager.get_by_id(pizzas.id)
+
+    Category.manager.save(Category(id=pizzas.id, name="pizzas"))
+    cached = pizzas.id in Category.manager.identity_map
+    reloaded_pizzas = Category.manager.get_by_id(pizzas.id)
+    Category.manager.delete_all()
+
+    assert not cached
+    assert reloaded_pizzas is not cached_pizzas
+    assert reloaded_pizzas.name == "pizzas"
+
+
+def test_basemanager_bulk_upsert_invalidates_the_identity_map():
+    Product.manager.create(id=1, name="nutella", url="http", nutriscore="e")
+    Product.manager.get_by_id(1)
+
+    Product.manager.bulk_upsert([
+        Product(id=1, name="nutella bio", url="http", nutriscore="e")
+    ])
+    product = Product.manager.get_by_id(1)
+    Product.manager.delete_all()
+
+    assert product.name == "nutella bio"
+
+
+def test_basemanager_get_by_ids_retrieves_several_instances():
+    pizzas = Category.manager.create(name="pizzas")
+    pates = Category.manager.create(name="pâtes à tartiner")
+    Category.manager.identity_map.clear()
+
+    categories = Category.manager.get_by_ids([pizzas.id, pates.id, 0])
+    cached_pizzas = Category.manager.get_by_id(pizzas.id)
+    Category.manager.delete_all()
+
+    assert sorted(categories) == sorted([pizzas.id, pates.id])
+    assert categories[pates.id].name == "pâtes à tartiner"
+    # The instances retrieved are kept in the identity map
+    assert cached_pizzas is categories[pizzas.id]
+
+
+def test_basemanager_prefetch_loads_the_relations_of_every_instance():
+    Product.manager.bulk_create([
+        Product(id=1, name="nutella", url="http", nutriscore="e"),
+        Product(id=2, name="pâte à tartiner bio", url="http", nutriscore="c"),
+    ])
+    pates = Category.manager.create(name="pâtes à tartiner")
+    ProductCategory.manager.create(product=1, category=pates.id)
+    Favorite.manager.create(product=1, substitute=2)
+
+    products = Product.manager.get_all(
+        order_by=["id"], prefetch=["categories", "stores"]
+    )
+    favorites = Favorite.manager.get_all(prefetch=["products"])
+    Favorite.manager.delete_all()
+    ProductCategory.manager.delete_all()
+    Category.manager.delete_all()
+    Product.manager.delete_all()
+
+    assert [
+        [category.name for category in product.get_categories()]
+        for product in products
+    ] == [["pâtes à tartiner"], []]
+    assert products[0].get_stores() == []
+    assert favorites[0].get_product().name == "nutella"
+    assert favorites[0].get_substitute().name == "pâte à tartiner bio"
+
+
+def test_basemanager_prefetch_rejects_unknown_relations():
+    with pytest.raises(ValueError):
+        Product.manager.prefetch([], ["favorites"])
@@ -66,3 +66,13 @@ def test_normalizes_does_its_job_correctly():
     assert len(valid_product['categories']) == 3
     assert "product_name" not in valid_product
     assert "name" in valid_product
+
+
+def test_iter_normalize_normalizes_the_products_lazily():
+    valid_products = deepcopy(data.get_valid_products())
+    normalizer = normalizers.ProductNormalizer()
+    normalized_products = normalizer.iter_normalize(iter(valid_products))
+    assert "product_name" in valid_products[0]
+    valid_product = next(normalized_products)
+    assert "product_name" not in valid_product
+    assert "name" in valid_product
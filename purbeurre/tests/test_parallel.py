@@ -0,0 +1,59 @@
+from copy import deepcopy
+
+import pytest
+
+from purbeurre.normalizers import ProductNormalizer
+from purbeurre.parallel import ParallelProcessor
+from purbeurre.tests import test_data as data
+from purbeurre.validators import ProductValidator
+
+
+def make_products(number):
+    return [
+        {**data.VALID_PRODUCT, "code": index}
+        if index % 3 else data.INVALID_PRODUCT_WITH_EMPTY_NAME
+        for index in range(number)
+    ]
+
+
+def validate_code_is_even(product):
+    return product["code"] % 2 == 0
+
+
+class EvenCodeValidator(ProductValidator):
+    validators = ProductValidator.validators + [validate_code_is_even]
+
+
+class OddCodeValidator(ProductValidator):
+    def is_valid(self, product):
+        return product["code"] % 2 == 1
+
+
+def test_parallel_processing_keeps_the_order_of_the_products():
+    products = make_products(1000)
+    processor = ParallelProcessor(max_workers=2, min_chunk_size=100)
+    processed_products = processor.process_all(deepcopy(products))
+
+    expected_products = ProductValidator().filter(deepcopy(products))
+    ProductNormalizer().normalize_all(expected_products)
+    assert processed_products == expected_products
+
+
+def test_parallel_processing_applies_custom_rules():
+    processor = ParallelProcessor(
+        validator=EvenCodeValidator(), max_workers=2, min_chunk_size=100
+    )
+    processed_products = processor.process_all(make_products(1000))
+    assert [product["id"] for product in processed_products[:3]] == [2, 4, 8]
+
+
+def test_parallel_processing_rejects_overridden_methods():
+    with pytest.raises(ValueError, match="OddCodeValidator"):
+        ParallelProcessor(validator=OddCodeValidator())
+
+
+def test_chunks_and_workers_adapt_to_the_number_of_products():
+    processor = ParallelProcessor(max_workers=8, min_chunk_size=500)
+    assert processor.plan(100) == (1, 500)
+    assert processor.plan(2000) == (4, 500)
+    assert processor.plan(1000000) == (8, 10000)
@@ -0,0 +1,75 @@
+import time
+
+import pytest
+
+from purbeurre.pipeline import Pipeline
+
+
+def test_pipeline_applies_the_stages_in_order():
+    results = []
+    pipeline = (
+        Pipeline()
+        .source("source", range(10))
+        .stage("double", lambda number: number * 2)
+        .stage("collect", results.append)
+    )
+    pipeline.run()
+
+    assert results == [number * 2 for number in range(10)]
+    assert [stats.items for stats in pipeline.stats] == [10, 10, 10]
+
+
+def test_pipeline_runs_the_stages_at_the_same_time():
+    def slow_source():
+        for number in range(5):
+            time.sleep(0.05)
+            yield number
+
+    def slow_stage(number):
+        time.sleep(0.05)
+
+    start = time.monotonic()
+    pipeline = (
+        Pipeline()
+        .source("source", slow_source())
+        .stage("first", slow_stage)
+        .stage("second", slow_stage)
+    )
+    pipeline.run()
+
+    # 0.75s if the stages ran one after the other
+    assert time.monotonic() - start < 0.6
+
+
+def test_pipeline_reports_the_bottleneck():
+    pipeline = (
+        Pipeline(queue_size=1)
+        .source("source", range(5))
+        .stage("slow", lambda number: time.sleep(0.02))
+        .stage("fast", lambda result: None)
+    )
+    pipeline.run()
+
+    assert pipeline.bottleneck == "slow"
+    assert pipeline.stats[0].blocked_time > 0
+    assert "Bottleneck: slow" in pipeline.report()
+
+
+def test_pipeline_stops_when_a_stage_fails():
+    def fail(number):
+        if number == 3:
+            raise ValueError("invalid product")
+
+    def endless_source():
+        number = 0
+        while True:
+            yield number
+            number += 1
+
+    pipeline = (
+        Pipeline()
+        .source("source", endless_source())
+        .stage("fail", fail)
+    )
+    with pytest.raises(ValueError):
+        pipeline.run()
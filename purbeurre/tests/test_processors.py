@@ -0,0 +1,27 @@
+from copy import deepcopy
+
+from purbeurre.normalizers import ProductNormalizer
+from purbeurre.processors import ProductProcessor
+from purbeurre.tests import test_data as data
+from purbeurre.validators import ProductValidator
+
+
+def test_processor_gives_the_same_result_as_validator_and_normalizer():
+    products = [
+        data.INVALID_PRODUCT_WITHOUT_CODE,
+        {**data.VALID_PRODUCT, "energy_100g": 500.0},
+        data.INVALID_PRODUCT_WITH_EMPTY_NAME,
+        data.INVALID_PRODUCT_WITH_EMPTY_GENERIC_NAME,
+    ]
+    expected_products = ProductValidator().filter(deepcopy(products))
+    ProductNormalizer().normalize_all(expected_products)
+
+    processed_products = list(ProductProcessor().iter_process(products))
+
+    assert processed_products == expected_products
+
+
+def test_processor_does_not_modify_the_original_product():
+    product = {**data.VALID_PRODUCT}
+    ProductProcessor().process(product)
+    assert product == data.VALID_PRODUCT
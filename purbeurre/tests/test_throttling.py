@@ -0,0 +1,42 @@
+import time
+
+from purbeurre.throttling import AdaptiveLimiter, TokenBucket
+
+
+def test_token_bucket_limits_the_rate():
+    bucket = TokenBucket(rate=50, capacity=1)
+    start = time.monotonic()
+    for i in range(6):
+        bucket.acquire()
+    # The first token is available at once, the 5 others take 20ms each
+    assert time.monotonic() - start >= 0.09
+
+
+def test_adaptive_limiter_backs_off_on_overload():
+    limiter = AdaptiveLimiter(max_limit=8)
+    limiter.on_overload()
+    assert limiter.limit == 4
+    limiter.on_overload()
+    limiter.on_overload()
+    limiter.on_overload()
+    assert limiter.limit == 1
+
+
+def test_adaptive_limiter_backs_off_on_latency_spikes():
+    limiter = AdaptiveLimiter(max_limit=8)
+    for i in range(10):
+        limiter.on_success(0.1)
+    limiter.on_success(1.0)
+    assert limiter.limit == 4
+
+
+def test_adaptive_limiter_ramps_up_when_healthy():
+    limiter = AdaptiveLimiter(max_limit=8)
+    limiter.on_overload()
+    limiter.on_overload()
+    for i in range(20):
+        limiter.on_success(0.1)
+    assert limiter.limit > 4
+    for i in range(100):
+        limiter.on_success(0.1)
+    assert limiter.limit == 8
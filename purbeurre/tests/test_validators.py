@@ -1,4 +1,4 @@
-from purbeurre.validators import ProductValidator
+from purbeurre.validators import BarcodeSet, ProductValidator
 
 from purbeurre.tests import test_data as data
 
@@ -22,3 +22,29 @@ def test_only_invalid_products_are_removed_by_product_validator():
     validator = ProductValidator()
     filtered_products = validator.filter(invalid_products_but_one)
     assert len(filtered_products) == 1
+
+
+def test_iter_filter_keeps_only_valid_products():
+    products = [
+        data.INVALID_PRODUCT_WITHOUT_CODE,
+        data.VALID_PRODUCT,
+        data.INVALID_PRODUCT_WITH_EMPTY_NAME,
+    ]
+    validator = ProductValidator()
+    filtered_products = validator.iter_filter(iter(products))
+    assert list(filtered_products) == [data.VALID_PRODUCT]
+
+
+def test_barcode_set_keeps_the_first_product_of_each_barcode():
+    products = [
+        {"code": "3017620422003", "product_name": "first"},
+        {"code": "3017620422003", "product_name": "second"},
+        {"code": "0012", "product_name": "third"},
+        {"code": "12", "product_name": "same primary key as third"},
+    ]
+    barcodes = BarcodeSet()
+    unique_products = list(barcodes.iter_unique(products))
+    assert [product["product_name"] for product in unique_products] == [
+        "first", "third"
+    ]
+    assert len(barcodes) == 2
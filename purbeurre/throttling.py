@@ -0,0 +1,131 @@
+"""This module contains the tools used to limit the load put on the
+openfoodfacts servers.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+
+class TokenBucket:
+    """Rate limiter letting through rate requests per second on average,
+    with bursts of at most capacity requests.
+    """
+
+    def __init__(self, rate, capacity=1):
+        """Initializes a full bucket.
+
+        Args:
+            rate (float): number of tokens added to the bucket per second.
+            capacity (int): maximum number of tokens in the bucket.
+            Default value is 1.
+
+        """
+        if rate <= 0:
+            raise ValueError("rate must be greater than 0")
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Takes a token from the bucket, waiting for one if necessary."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity,
+                    self._tokens + (now - self._updated_at) * self.rate,
+                )
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+
+
+class AdaptiveLimiter:
+    """Concurrency limiter adapting the number of simultaneous requests to
+    the health of the server.
+
+    The limit grows by one request per round of successful requests and is
+    halved when the server is overloaded, that is when it answers with
+    errors or when its latency rises well above its usual value.
+    """
+
+    def __init__(
+        self, max_limit, min_limit=1, latency_factor=2.0, smoothing=0.2
+    ):
+        """Initializes a limiter allowing max_limit simultaneous requests.
+
+        Args:
+            max_limit (int): maximum number of simultaneous requests.
+            min_limit (int): minimum number of simultaneous requests.
+            Default value is 1.
+            latency_factor (float): a latency this many times higher than
+            the average latency is considered as a sign of overload.
+            Default value is 2.
+            smoothing (float): weight of the last latency in the average
+            latency. Default value is 0.2.
+
+        """
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.latency_factor = latency_factor
+        self.smoothing = smoothing
+        self.limit = float(max_limit)
+        self.average_latency = None
+        self._in_flight = 0
+        self._condition = threading.Condition()
+
+    @contextmanager
+    def slot(self):
+        """Waits until a new request is allowed and keeps it counted until
+        the end of the block.
+        """
+        with self._condition:
+            while self._in_flight >= int(self.limit):
+                self._condition.wait()
+            self._in_flight += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._in_flight -= 1
+                self._condition.notify_all()
+
+    def on_success(self, latency):
+        """Records the latency of a successful request.
+
+        Args:
+            latency (float): time to get the response, in seconds.
+
+        """
+        with self._condition:
+            if (
+                self.average_latency is not None
+                and latency > self.latency_factor * self.average_latency
+            ):
+                self._decrease()
+            else:
+                # Additive increase: +1 once every request of the current
+                # limit succeeded
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            if self.average_latency is None:
+                self.average_latency = latency
+            else:
+                self.average_latency += self.smoothing * (
+                    latency - self.average_latency
+                )
+            self._condition.notify_all()
+
+    def on_overload(self):
+        """Records a request rejected or failed because of the load."""
+        with self._condition:
+            self._decrease()
+
+    def _decrease(self):
+        """Multiplicative decrease of the limit."""
+        self.limit = max(self.min_limit, self.limit / 2)
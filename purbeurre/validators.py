@@ -1,19 +1,17 @@
+PRODUCT_FIELDS = frozenset({
+    "code", "product_name", "categories", "stores", "nutriscore_grade",
+    "url", "generic_name"
+})
+
+
 def validate_fields_are_present_in_product(product):
-    fields = {
-        "code", "product_name", "categories", "stores", "nutriscore_grade",
-        "url", "generic_name"
-    }
-    if fields - product.keys():
+    if PRODUCT_FIELDS - product.keys():
         return False
     return True
 
 
 def validate_fields_are_not_empty_in_product(product):
-    fields = {
-        "code", "product_name", "categories", "stores", "nutriscore_grade",
-        "url", "generic_name"
-    }
-    for field in fields:
+    for field in PRODUCT_FIELDS:
         if isinstance(product[field], str) and not product[field].strip():
             return False
     return True
@@ -60,3 +58,69 @@ class ProductValidator:
             if self.is_valid(product):
                 filtered_products.append(product)
         return filtered_products
+
+    def iter_filter(self, products):
+        """Lazy counterpart of filter(), eliminates invalid products one at
+        a time.
+
+        Args:
+            products (iterable): products to filter, for instance the
+            generator returned by OpenfoodfactsClient.iter_products().
+
+        Return:
+            A generator of the products considered valid.
+
+        """
+        for product in products:
+            if self.is_valid(product):
+                yield product
+
+
+class BarcodeSet:
+    """Set of the barcodes of the products already accepted, used to keep a
+    single product per barcode.
+
+    The barcodes are stored as integers: the check is done in constant time,
+    an integer takes less memory than the string of the barcode, and two
+    barcodes which only differ by their leading zeros, which would collide
+    in the primary key of the product table, are considered equal.
+    """
+
+    def __init__(self):
+        """Initializes an empty set."""
+        self._barcodes = set()
+
+    def __len__(self):
+        return len(self._barcodes)
+
+    def add(self, barcode):
+        """Adds a barcode to the set.
+
+        Return:
+            True if the barcode was not in the set yet.
+
+        """
+        barcode = str(barcode).strip()
+        key = int(barcode) if barcode.isdigit() else barcode
+        if key in self._barcodes:
+            return False
+        self._barcodes.add(key)
+        return True
+
+    def iter_unique(self, products, field="code"):
+        """Eliminates the products whose barcode has already been seen, the
+        first product of each barcode being kept.
+
+        Args:
+            products (iterable): products to filter.
+            field (str): field holding the barcode, "code" for the products
+            of openfoodfacts and "id" for the normalized products. Default
+            value is "code".
+
+        Return:
+            A generator of the products with a new barcode.
+
+        """
+        for product in products:
+            if self.add(product[field]):
+                yield product
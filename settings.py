@@ -1,3 +1,5 @@
+import os
+
 
 DB_USER = 'purbeurre'
 DB_PASSWORD = 'AzEr-Ty123-'
@@ -6,8 +8,53 @@ DB_HOST = 'localhost'
 DB_PORT = 3306
 DB_CHARSET = 'utf8mb4'
 DB_COLLATION = 'utf8mb4_unicode_ci'
+# Maximum number of connections opened at once, one per thread using the
+# database
+DB_POOL_SIZE = 5
+# Seconds waited for a free connection before giving up
+DB_POOL_TIMEOUT = 30
+# Seconds a pooled connection can stay idle before being checked again
+DB_POOL_PING_INTERVAL = 30
+# Number of rows inserted per multi-row INSERT by the bulk operations
+DB_BATCH_SIZE = 1000
+# Number of category and store names whose id is kept in memory
+NAME_CACHE_SIZE = 100000
+# Number of instances of each model kept in memory by get_by_id()
+IDENTITY_MAP_SIZE = 1000
 
+# Openfoodfacts endpoints ("fr", "en" or "world") in order of preference,
+# a product present on several of them is installed from the first one
+PRODUCT_CLIENT_LANGS = ['fr']
 PRODUCT_CLIENT_PAGE_SIZE = 1000
 PRODUCT_CLIENT_NUMBER_OF_PAGES = 10
+PRODUCT_CLIENT_MAX_WORKERS = 4
+# The search API of openfoodfacts allows 10 requests per minute
+PRODUCT_CLIENT_RATE_LIMIT = 10 / 60  # requests per second
+PRODUCT_CLIENT_MAX_RETRIES = 3
+
+# Number of processes validating and normalizing the products of an export,
+# None uses every processor
+PROCESSING_WORKERS = None
+# Number of pages or batches waiting between two steps of the installation
+PIPELINE_QUEUE_SIZE = 2
+
+# Cache of the openfoodfacts responses, None disables it
+HTTP_CACHE_DIR = os.path.join(os.path.dirname(__file__), '.cache', 'http')
+HTTP_CACHE_TTL = 24 * 60 * 60  # seconds
+HTTP_CACHE_MAX_SIZE = 500 * 1024 * 1024  # bytes
+
+# Journal of the progress of install.py, used to resume an interrupted run
+INSTALL_CHECKPOINT_FILE = os.path.join(
+    os.path.dirname(__file__), '.cache', 'install.checkpoint'
+)
+
+# Time from which the next run of install.py --sync downloads the modified
+# products, by endpoint
+SYNC_STATE_FILE = os.path.join(
+    os.path.dirname(__file__), '.cache', 'sync.json'
+)
+# The products modified this long before the last synchronization are
+# downloaded again, in case they were indexed late by openfoodfacts
+SYNC_OVERLAP = 60 * 60  # seconds
 
 CATEGORIES = ['biscuits au chocolat', 'pâtes à tartiner', 'gratins de poisson']
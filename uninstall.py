@@ -1,4 +1,12 @@
+import os
+
+from settings import INSTALL_CHECKPOINT_FILE, SYNC_STATE_FILE
 from purbeurre.database import drop_tables
 
 if __name__ == "__main__":
     drop_tables()
+    # The progress of an interrupted installation and the time of the last
+    # synchronization are lost with the tables
+    for path in (INSTALL_CHECKPOINT_FILE, SYNC_STATE_FILE):
+        if os.path.exists(path):
+            os.remove(path)